@@ -5,7 +5,7 @@ from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from base64 import b64decode
 
-from models.openai_models import get_open_ai, get_open_ai_json
+from models.openai_models import get_open_ai, get_open_ai_json, DEFAULT_MAX_RETRIES
 # from models.ollama_models import OllamaModel, OllamaJSONModel
 # from models.vllm_models import VllmJSONModel, VllmModel
 # from models.groq_models import GroqModel, GroqJSONModel
@@ -32,9 +32,9 @@ class Agent:
         self.stop = stop
         self.guided_json = guided_json
 
-    def get_llm(self, json_model=True):
+    def get_llm(self, json_model=True, max_retries=DEFAULT_MAX_RETRIES, include_response_headers=False):
         if self.server == 'openai':
-            return get_open_ai_json(model=self.model, temperature=self.temperature) if json_model else get_open_ai(model=self.model, temperature=self.temperature)
+            return get_open_ai_json(model=self.model, temperature=self.temperature, max_retries=max_retries, include_response_headers=include_response_headers) if json_model else get_open_ai(model=self.model, temperature=self.temperature, max_retries=max_retries, include_response_headers=include_response_headers)
         # if self.server == 'ollama':
         #     return OllamaJSONModel(model=self.model, temperature=self.temperature) if json_model else OllamaModel(model=self.model, temperature=self.temperature)
         # if self.server == 'vllm':
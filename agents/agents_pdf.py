@@ -11,43 +11,319 @@ from langchain.retrievers.multi_vector import MultiVectorRetriever
 import os
 import uuid
 import json
-from base64 import b64decode
-from unstructured.partition.pdf import partition_pdf
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from prompts.prompts import (
     pdf_text_summary_prompt_template,
     pdf_table_summary_prompt_template,
     pdf_image_summary_prompt_template,
+    pdf_packed_summary_prompt_template,
     pdf_reporter_prompt_template
 )
-from utils.helper_functions import get_current_utc_datetime, load_config
+from utils.helper_functions import get_current_utc_datetime, load_config, get_file_hash, get_content_hash
+from utils.artifact_cache import artifact_cache
 from states.state import AgentGraphState
 from agents.agents import Agent
 
-from vectorstore.vectorstore import VectorStoreManager
+from vectorstore.vectorstore import VectorStoreManager, DEFAULT_EMBEDDING_MODEL, get_persist_dir, get_corpus_dir
+from vectorstore.registry import retriever_registry
+from vectorstore.hybrid import DEFAULT_LEXICAL_K
+from vectorstore.entries import as_entry
+from vectorstore.vectorstore import get_page_number, get_page_numbers
+from tools.image_processing import ImagePreprocessor
+from tools.summary_scheduler import (
+    SummaryScheduler,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    SUMMARY_OUTPUT_TOKENS,
+    count_tokens,
+    pack_by_token_budget,
+)
+from tools.context_packer import ContextPacker, DEFAULT_CONTEXT_TOKEN_BUDGET
+from tools.table_format import compact_tables, DEFAULT_TABLE_TEXT_FORMAT
+from tools.table_query import TableQueryEngine, format_number
+from tools.pdf_partition import (
+    partition_pdf_parallel,
+    partition_pdf_adaptive,
+    partition_pdf_incremental,
+    has_cached_pages,
+    get_page_hashes,
+    DEFAULT_PAGES_PER_RANGE,
+)
 
 config_path = os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml")
 load_config(config_path)
 
+# Parameters of the partition_pdf call, part of the cache key of its output
+PARTITION_PARAMS = {
+    "infer_table_structure": True,
+    "strategy": "hi_res",
+    "extract_image_block_types": ["Image"],
+    "extract_image_block_to_payload": True,
+    "chunking_strategy": "by_title",
+    "max_characters": 10000,
+    "combine_text_under_n_chars": 2000,
+    "new_after_n_chars": 6000,
+}
+
+SUMMARY_PROMPTS = {
+    "text": pdf_text_summary_prompt_template,
+    "table": pdf_table_summary_prompt_template,
+    "image": pdf_image_summary_prompt_template,
+}
+
+# Chunks up to this size are packed together when pack_summaries is enabled
+PACK_MAX_CHUNK_TOKENS = 800
+# Input tokens of the chunks packed into one summary request
+DEFAULT_PACK_TOKEN_BUDGET = 3000
+# Documents ingested at the same time into the shared corpus
+DEFAULT_INGEST_WORKERS = 4
+
+# Shared multi-document vectorstores, one per embedding model
+_corpus_managers = {}
+_corpus_lock = threading.Lock()
+
+# "background" summarizes tables and images after the texts are indexed,
+# "on_demand" only those next to the text chunks a question retrieves
+LAZY_MODES = ("background", "on_demand")
+# Tables and images of a persisted document not summarized yet
+PENDING_MODALITIES_FILE = "pending_modalities.pkl"
+
+# Documents with pending tables or images, by file hash
+_lazy_ingestions = {}
+
+# Share of its pages a new upload must have in common with a corpus document
+# to be ingested as a revision of it
+REVISION_MIN_SHARED_PAGES = 0.5
+
+
+def parse_packed_summaries(response, expected_count):
+    """
+    Reads the per-chunk summaries of a packed request, None if the response is unusable.
+    """
+    try:
+        entries = json.loads(response)["summaries"]
+        summaries = [entry["summary"] if isinstance(entry, dict) else entry for entry in entries]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if len(summaries) != expected_count or not all(isinstance(summary, str) and summary for summary in summaries):
+        return None
+    return summaries
+
+class LazyIngestion:
+    def __init__(self, agent, vectorstore_manager, source_id, tables, images, chunk_images, lock=None,
+                 image_pages=None):
+        """
+        Tables and images of one document whose summaries are not indexed yet.
+        chunk_images maps a text chunk id to the indices of the images it contains,
+        image_pages holds the pages every image appears on.
+        lock serializes vectorstore writes with the retrievals of the agent.
+        """
+        self.agent = agent
+        self.vectorstore_manager = vectorstore_manager
+        self.source_id = source_id
+        self.tables = dict(enumerate(tables))
+        self.images = dict(enumerate(images))
+        self.chunk_images = chunk_images
+        self.image_pages = dict(zip(images, image_pages or []))
+        self.lock = lock or threading.RLock()
+        self.thread = None
+
+    @property
+    def done(self):
+        return not self.tables and not self.images
+
+    @property
+    def pending_path(self):
+        if self.vectorstore_manager.persist_dir is None:
+            return None
+        return os.path.join(self.vectorstore_manager.persist_dir, PENDING_MODALITIES_FILE)
+
+    def _take(self, table_indices, image_indices):
+        # Pending elements are taken once, whoever asks first summarizes them
+        with self.lock:
+            tables = [self.tables.pop(i) for i in table_indices if i in self.tables]
+            images = [self.images.pop(i) for i in image_indices if i in self.images]
+        return tables, images
+
+    def ingest(self, tables, images):
+        if not tables and not images:
+            return 0
+
+        def add(modality, element, summary):
+            pages = self.image_pages.get(element) if modality == "image" else None
+            with self.lock:
+                self.vectorstore_manager.stream_add(element, summary, source_id=self.source_id, pages=pages)
+
+        llm = self.agent.get_llm(max_retries=0, include_response_headers=True)
+        self.agent.summarize_elements(llm, {"table": tables, "image": images}, on_result=add)
+        with self.lock:
+            self.vectorstore_manager.flush()
+            self.save()
+        print(colored(f"Lazy ingestion: indexed {len(tables)} tables and {len(images)} images", 'cyan'))
+        return len(tables) + len(images)
+
+    def ingest_all(self):
+        return self.ingest(*self._take(list(self.tables), list(self.images)))
+
+    def start_background(self):
+        self.thread = threading.Thread(target=self.ingest_all, daemon=True)
+        self.thread.start()
+
+    def ingest_hits(self, entries):
+        """
+        Summarizes the pending images of the retrieved text chunks and the
+        pending tables on their pages. Returns the number of elements indexed.
+        """
+        pages = set()
+        image_indices = set()
+        for entry in entries:
+            if entry.modality != "text":
+                continue
+            chunk = entry.content
+            image_indices.update(self.chunk_images.get(getattr(chunk, "id", None), ()))
+            pages.add(get_page_number(chunk))
+            for element in getattr(chunk.metadata, "orig_elements", None) or []:
+                pages.add(get_page_number(element))
+        with self.lock:
+            table_indices = [i for i, table in self.tables.items() if get_page_number(table) in pages]
+        return self.ingest(*self._take(table_indices, image_indices))
+
+    def save(self):
+        """
+        Writes the vectorstore and the remaining pending elements to persist_dir.
+        """
+        if self.done:
+            _lazy_ingestions.pop(self.source_id, None)
+        if self.pending_path is None:
+            return
+        self.vectorstore_manager.save_vectorstore()
+        if self.done:
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+            return
+        with open(self.pending_path + ".tmp", "wb") as file:
+            pickle.dump(
+                (self.tables, self.images, self.chunk_images, self.image_pages), file, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(self.pending_path + ".tmp", self.pending_path)
+
+    @classmethod
+    def load(cls, agent, vectorstore_manager, source_id):
+        lazy_ingestion = cls(agent, vectorstore_manager, source_id, [], [], {})
+        with open(lazy_ingestion.pending_path, "rb") as file:
+            pending = pickle.load(file)
+        if len(pending) == 3:  # Saved before image pages were kept
+            pending = (*pending, {})
+        lazy_ingestion.tables, lazy_ingestion.images, lazy_ingestion.chunk_images, lazy_ingestion.image_pages = pending
+        return lazy_ingestion
+
+
 class PDFReporterAgent(Agent):
-    def __init__(self,retriever=None, *args, **kwargs):
+    def __init__(self,retriever=None, embedding_model=DEFAULT_EMBEDDING_MODEL,
+                 partition_workers=1, pages_per_range=DEFAULT_PAGES_PER_RANGE,
+                 partition_strategy="hi_res", pack_summaries=False,
+                 pack_token_budget=DEFAULT_PACK_TOKEN_BUDGET, image_preprocessor=None,
+                 index_type="auto", search_kwargs=None, lexical_k=DEFAULT_LEXICAL_K, fused_k=None,
+                 ingest_workers=DEFAULT_INGEST_WORKERS, context_token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                 lazy_modalities=None, incremental=True, quantization=None,
+                 table_format=DEFAULT_TABLE_TEXT_FORMAT, table_fast_path=False,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.retriever = retriever
-
-    def extract_pdf_elements(self, file_path):
-        chunks = partition_pdf(
-            filename=file_path,
-            infer_table_structure=True,
-            strategy="hi_res",
-            extract_image_block_types=["Image"],
-            extract_image_block_to_payload=True,
-            chunking_strategy="by_title",
-            max_characters=10000,
-            combine_text_under_n_chars=2000,
-            new_after_n_chars=6000,
-        )
+        self.embedding_model = embedding_model
+        # partition_workers > 1 (or None for one per CPU) partitions page ranges in parallel
+        self.partition_workers = partition_workers
+        self.pages_per_range = pages_per_range
+        # "adaptive" picks fast or hi_res per page from its text layer
+        self.partition_strategy = partition_strategy
+        self.partition_report = None
+        # Summarize several small chunks per request
+        self.pack_summaries = pack_summaries
+        # Summary request budget, the limits of the OpenAI usage tier of the API key
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.pack_token_budget = pack_token_budget
+        # Dedup, filter and downscale images before the vision calls
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor()
+        # ANN index of the vectorstore and retriever search kwargs (k, nprobe, ef_search)
+        self.index_type = index_type
+        self.search_kwargs = search_kwargs
+        # "fp16", "int8" or "pq" compresses the index, re-ranking with float32 vectors on disk
+        self.quantization = quantization
+        # BM25 results fused with the vector results, and size of the fused list
+        self.lexical_k = lexical_k
+        self.fused_k = fused_k
+        # Uploads ingested in parallel when several PDFs are loaded
+        self.ingest_workers = ingest_workers
+        # Tokens of the reporter prompt including the retrieved context
+        self.context_token_budget = context_token_budget
+        self.context_report = None
+        # None summarizes everything up front, otherwise one of LAZY_MODES
+        if lazy_modalities is not None and lazy_modalities not in LAZY_MODES:
+            raise ValueError(f"Unknown lazy mode: {lazy_modalities}. Choose one of {LAZY_MODES}.")
+        self.lazy_modalities = lazy_modalities
+        self.lazy_ingestion = None
+        # Partition only pages not seen before and update revised corpus documents page by page
+        self.incremental = incremental
+        # Tables are summarized, indexed and prompted as "markdown" or "csv" instead of HTML
+        self.table_format = table_format
+        # Opt-in: clear lookup and aggregate questions on retrieved tables are answered from
+        # their dataframes, the matching slice goes into the prompt ahead of the packed context
+        self.table_query_engine = TableQueryEngine() if table_fast_path else None
+        self.table_answer = None
+
+    def extract_pdf_elements(self, file_path, file_hash=None):
+        # The same file partitioned with the same parameters always gives the same chunks
+        file_hash = file_hash or get_file_hash(file_path)
+        partition_params = {**PARTITION_PARAMS, "strategy": self.partition_strategy}
+        cache_key = artifact_cache.make_key(file_hash, partition_params)
+        chunks = artifact_cache.get("partition", cache_key)
+        if chunks is not None:
+            print(colored(f"Partition cache hit for {file_hash[:12]}", 'green'))
+            return chunks
+
+        # Pages are only looked up one by one when some were partitioned before, in
+        # this file or a previous revision, otherwise they are cached for the next revision
+        page_hashes = self.get_page_hashes(file_path, file_hash) if self.incremental else None
+        if page_hashes is not None and has_cached_pages(page_hashes, partition_params):
+            chunks, self.partition_report = partition_pdf_incremental(
+                file_path,
+                partition_params,
+                page_hashes=page_hashes,
+                max_workers=self.partition_workers,
+                pages_per_range=self.pages_per_range,
+            )
+        elif self.partition_strategy == "adaptive":
+            chunks, self.partition_report = partition_pdf_adaptive(
+                file_path,
+                partition_params,
+                max_workers=self.partition_workers,
+                pages_per_range=self.pages_per_range,
+                page_hashes=page_hashes,
+            )
+        else:
+            chunks = partition_pdf_parallel(
+                file_path,
+                partition_params,
+                max_workers=self.partition_workers,
+                pages_per_range=self.pages_per_range,
+                page_hashes=page_hashes,
+            )
+        artifact_cache.put("partition", cache_key, chunks)
         return chunks
 
+    def get_page_hashes(self, file_path, file_hash=None):
+        file_hash = file_hash or get_file_hash(file_path)
+        page_hashes = artifact_cache.get("page_hashes", file_hash)
+        if page_hashes is None:
+            page_hashes = get_page_hashes(file_path)
+            artifact_cache.put("page_hashes", file_hash, page_hashes)
+        return page_hashes
+
     def separate_elements(self, chunks):
         tables = []
         texts = []
@@ -78,82 +354,413 @@ class PDFReporterAgent(Agent):
         if isinstance(extracted_text, str):  # Ensure list format for batch processing
             extracted_text = [extracted_text]
 
-        current_datetime = get_current_utc_datetime()
-        text_summary_prompt = prompt + f"\n\nCurrent date and time: {current_datetime}"
-
-
-        messages = ChatPromptTemplate.from_template(text_summary_prompt)
-        summarize_chain = {"extracted_text": lambda x: x} | messages | llm | StrOutputParser()
-        text_summaries = summarize_chain.batch(extracted_text, {"max_concurrency": 3})
+        text_summaries = self.summarize_elements(llm, {"text": extracted_text}, prompts={"text": prompt})["text"]
         return text_summaries
 
     def summarize_table(self, llm, extracted_table, prompt=pdf_table_summary_prompt_template):
         if not extracted_table:
             return []
-        current_datetime = get_current_utc_datetime()
-        table_summary_prompt = prompt + f"\n\nCurrent date and time: {current_datetime}"
 
-        messages = ChatPromptTemplate.from_template(table_summary_prompt)
+        tables_summaries = self.summarize_elements(llm, {"table": extracted_table}, prompts={"table": prompt})["table"]
 
-        summarize_chain = {"extracted_table": lambda x: x} | messages | llm | StrOutputParser()
-        tables_summaries = summarize_chain.batch(extracted_table, {"max_concurrency": 3})
-
-        print(colored(f"Table Summary : {tables_summaries}", 'Yellow'))
+        print(colored(f"Table Summary : {tables_summaries}", 'yellow'))
         return tables_summaries
 
     def summarize_image(self, llm, extracted_images, prompt=pdf_image_summary_prompt_template):
         if not extracted_images:
             return []
-        
-        current_datetime = get_current_utc_datetime()
-        image_summary_prompt = prompt + f"\n\nCurrent date and time: {current_datetime}"
-
-        messages = [
-            (
-                "user",
-                [
-                    {"type": "text", "text": image_summary_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": "data:image/jpeg;base64,{image}"},
-                    },
-                ],
-            )
-        ]
-
-        prompt = ChatPromptTemplate.from_messages(messages)
 
-        summarize_chain = prompt | llm | StrOutputParser()
-        images_summaries = summarize_chain.batch(extracted_images)
+        images_summaries = self.summarize_elements(llm, {"image": extracted_images}, prompts={"image": prompt})["image"]
 
-        print(colored(f"Image Summary : {images_summaries}", 'Pink'))
+        print(colored(f"Image Summary : {images_summaries}", 'light_magenta'))
         return images_summaries
 
-    def pdf_extraction_tool(self, file_path: str):
-        llm = self.get_llm()
-        chunks = self.extract_pdf_elements(file_path)  # Extract elements from PDF
+    def build_summary_chain(self, llm, modality, prompt):
+        """
+        Builds the summary chain of one modality. The chain ends with the LLM,
+        the scheduler parses its output.
+        """
+        current_datetime = get_current_utc_datetime()
+        summary_prompt = prompt + f"\n\nCurrent date and time: {current_datetime}"
+
+        if modality == "image":
+            messages = [
+                (
+                    "user",
+                    [
+                        {"type": "text", "text": summary_prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": "data:image/jpeg;base64,{image}"},
+                        },
+                    ],
+                )
+            ]
+            return ChatPromptTemplate.from_messages(messages) | llm
+
+        input_key = "extracted_text" if modality == "text" else "extracted_table"
+        messages = ChatPromptTemplate.from_template(summary_prompt)
+        return {input_key: lambda x: x} | messages | llm
+
+    def summarize_elements(self, llm, elements_by_modality, prompts=None, on_result=None):
+        """
+        Summarizes texts, tables and images through one rate limited scheduler.
+        Cached summaries (keyed by chunk content, prompt template and model) are
+        reused, so changing a prompt re-runs summarization only.
+        With pack_summaries, small texts and tables share one request.
+        on_result(modality, element, summary) is called as soon as a summary is ready.
+        llm should be built with max_retries=0, so rate limit errors reach the scheduler,
+        and include_response_headers=True, so it follows the remaining quota.
+        """
+        prompts = {**SUMMARY_PROMPTS, **(prompts or {})}
+        model_name = getattr(llm, "model_name", self.model)
+        scheduler = SummaryScheduler(
+            model_name=model_name,
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
+        )
+        chains = {
+            modality: self.build_summary_chain(llm, modality, prompts[modality])
+            for modality in elements_by_modality
+        }
+
+        summaries = {modality: [None] * len(items) for modality, items in elements_by_modality.items()}
+        jobs = []
+        job_targets = []
+        packable = []  # (modality, i, cache_key, tokens) of small chunks
+
+        def add_single_job(modality, i, cache_key):
+            item = elements_by_modality[modality][i]
+            if modality == "image":
+                estimated_tokens = scheduler.estimate_tokens(prompts[modality], images=1)
+            else:
+                estimated_tokens = scheduler.estimate_tokens(prompts[modality] + str(item))
+            jobs.append((chains[modality], item, estimated_tokens))
+            job_targets.append([(modality, i, cache_key)])
+
+        def store(modality, i, cache_key, summary):
+            summaries[modality][i] = summary
+            artifact_cache.put("summary", cache_key, summary)
+            if on_result is not None:
+                on_result(modality, elements_by_modality[modality][i], summary)
+
+        for modality, items in elements_by_modality.items():
+            for i, item in enumerate(items):
+                prompt = prompts[modality]
+                chunk_tokens = None
+                if self.pack_summaries and modality != "image":
+                    chunk_tokens = count_tokens(str(item), model_name)
+                    if chunk_tokens <= PACK_MAX_CHUNK_TOKENS:
+                        prompt = prompts[modality] + pdf_packed_summary_prompt_template
+                    else:
+                        chunk_tokens = None
+
+                cache_key = artifact_cache.make_key(get_content_hash(str(item)), prompt, model_name)
+                cached_summary = artifact_cache.get("summary", cache_key)
+                if cached_summary is not None:
+                    summaries[modality][i] = cached_summary
+                    if on_result is not None:
+                        on_result(modality, item, cached_summary)
+                elif chunk_tokens is not None:
+                    packable.append((modality, i, cache_key, chunk_tokens))
+                else:
+                    add_single_job(modality, i, cache_key)
+
+        total = sum(len(items) for items in elements_by_modality.values())
+        print(colored(f"Summary cache: {total - len(jobs) - len(packable)}/{total} hits", 'green'))
+
+        # Group the small chunks into requests under the token budget
+        packed_chain = self.build_packed_summary_chain(llm)
+        for pack in pack_by_token_budget([chunk[3] for chunk in packable], self.pack_token_budget):
+            members = [packable[index][:3] for index in pack]
+            if len(members) == 1:
+                add_single_job(*members[0])
+                continue
+            extracted_chunks = "\n\n".join(
+                f"### Chunk {number}\n{elements_by_modality[modality][i]}"
+                for number, (modality, i, _) in enumerate(members, start=1)
+            )
+            estimated_tokens = scheduler.estimate_tokens(pdf_packed_summary_prompt_template + extracted_chunks)
+            estimated_tokens += SUMMARY_OUTPUT_TOKENS * (len(members) - 1)
+            jobs.append((packed_chain, {"extracted_chunks": extracted_chunks, "chunk_count": len(members)}, estimated_tokens))
+            job_targets.append(members)
+
+        fallback = []
+
+        def collect(job_index, summary):
+            members = job_targets[job_index]
+            if len(members) == 1:
+                store(*members[0], summary)
+                return
+            packed_summaries = parse_packed_summaries(summary, len(members))
+            if packed_summaries is None:
+                fallback.extend(members)  # Summarize them one by one instead
+                return
+            for (modality, i, cache_key), packed_summary in zip(members, packed_summaries):
+                store(modality, i, cache_key, json.dumps({f"{modality}_summary": packed_summary}))
+
+        packed_requests = sum(1 for members in job_targets if len(members) > 1)
+        scheduler.run(jobs, on_result=collect)
+
+        if fallback:
+            print(colored(f"Packed summaries could not be parsed, summarizing {len(fallback)} chunks one by one", 'yellow'))
+            jobs, job_targets = [], []
+            for member in fallback:
+                add_single_job(*member)
+            scheduler.run(jobs, on_result=collect)
+        if packed_requests:
+            print(colored(f"Packed {len(packable)} small chunks into {packed_requests} requests", 'cyan'))
+        return summaries
+
+    def build_packed_summary_chain(self, llm):
+        current_datetime = get_current_utc_datetime()
+        summary_prompt = pdf_packed_summary_prompt_template + f"\n\nCurrent date and time: {current_datetime}"
+        return ChatPromptTemplate.from_template(summary_prompt) | llm
+
+    def ingest_pdf(self, vectorstore_manager, file_path, file_hash=None, lock=None, lazy=False, pages=None):
+        """
+        Partitions and summarizes one PDF into vectorstore_manager, tagging its
+        vectors with the file hash as source id. lock guards a manager shared by
+        several ingesting threads. If pages is set, only chunks touching these pages are added.
+        With lazy=True only the texts are summarized, the LazyIngestion holding
+        the tables and images is returned.
+        """
+        # The summary scheduler retries and follows the rate limit headers of the responses
+        llm = self.get_llm(max_retries=0, include_response_headers=True)
+        file_hash = file_hash or get_file_hash(file_path)
+        lock = lock or threading.RLock()
+        chunks = self.extract_pdf_elements(file_path, file_hash)  # Extract elements from PDF
+        if pages is not None:
+            chunks = [chunk for chunk in chunks if get_page_numbers(chunk) & pages]
         texts, tables, images = self.separate_elements(chunks)  # Separate elements into text, tables, and images
-        
-        # Summarize data
-        text_summaries = self.summarize_text(llm, texts)
-        table_summaries = self.summarize_table(llm, tables)
-        image_summaries = self.summarize_image(llm, images)
-        
+        # Tables go on as compact Markdown/CSV with their cells in a columnar side file
+        tables = compact_tables(tables, self.table_format)
+        # Repeated images (e.g. logos on every page) are summarized and stored once
+        images, assignments = self.image_preprocessor.process(images)
+        # Images are bare base64 strings, their pages are kept apart so page updates find them
+        image_pages = self.get_image_pages(texts, assignments, len(images))
+        pages_by_image = dict(zip(images, image_pages))
+
+        def add(modality, element, summary):
+            pages = pages_by_image.get(element) if modality == "image" else None
+            with lock:
+                vectorstore_manager.stream_add(element, summary, source_id=file_hash, pages=pages)
+
+        # Summarize data, every summary goes into the vectorstore as soon as it is ready
+        elements = {"text": texts} if lazy else {"text": texts, "table": tables, "image": images}
+        self.summarize_elements(llm, elements, on_result=add)
+        with lock:
+            vectorstore_manager.flush()
+        if lazy:
+            chunk_images = self.get_chunk_images(texts, assignments)
+            return LazyIngestion(
+                self, vectorstore_manager, file_hash, tables, images, chunk_images, lock, image_pages=image_pages
+            )
+
+    def get_chunk_images(self, texts, assignments):
+        """
+        Maps every text chunk id to the indices of its preprocessed images,
+        following the image order of separate_elements.
+        """
+        chunk_images = {}
+        position = 0
+        for chunk in texts:
+            indices = []
+            for element in chunk.metadata.orig_elements:
+                if "Image" in str(type(element)):
+                    if assignments[position] is not None:
+                        indices.append(assignments[position])
+                    position += 1
+            chunk_images[chunk.id] = indices
+        return chunk_images
+
+    def get_image_pages(self, texts, assignments, image_count):
+        """
+        Pages every preprocessed image appears on, following the image order of
+        separate_elements. An image without a page number gets that of its chunk.
+        """
+        image_pages = [set() for _ in range(image_count)]
+        position = 0
+        for chunk in texts:
+            for element in chunk.metadata.orig_elements:
+                if "Image" in str(type(element)):
+                    if assignments[position] is not None:
+                        page_number = get_page_number(element)
+                        image_pages[assignments[position]].add(
+                            page_number if page_number is not None else get_page_number(chunk)
+                        )
+                    position += 1
+        return [sorted(pages - {None}) for pages in image_pages]
+
+    def start_lazy_ingestion(self, lazy_ingestion):
+        """
+        Registers the pending tables and images of a document, summarizing them
+        in the background, later on retrieval hits, or right away if this agent is not lazy.
+        """
+        if lazy_ingestion.done:
+            return
+        _lazy_ingestions[lazy_ingestion.source_id] = lazy_ingestion
+        if self.lazy_modalities is None:
+            lazy_ingestion.ingest_all()
+        elif self.lazy_modalities == "background":
+            lazy_ingestion.start_background()
+
+    def pdf_extraction_tool(self, file_path: str, persist_dir=None, file_hash=None):
         # Use the VectorStoreManager
-        vectorstore_manager = VectorStoreManager()
+        vectorstore_manager = self.create_vectorstore_manager(persist_dir)
         vectorstore_manager.create_vectorstore()  # Create the vectorstore
-        vectorstore_manager.add_to_vectorstore(
-            texts, tables, images, 
-            text_summaries, table_summaries, image_summaries
-        )  # Add data to the vectorstore
-        
+        file_hash = file_hash or get_file_hash(file_path)
+        lazy_ingestion = self.ingest_pdf(vectorstore_manager, file_path, file_hash, lazy=self.lazy_modalities is not None)
+        vectorstore_manager.build_ann_index()  # Train and build the configured index type
+        if lazy_ingestion is not None:
+            lazy_ingestion.save()  # Keep it for the next process, along with the pending tables and images
+            self.start_lazy_ingestion(lazy_ingestion)
+        elif persist_dir is not None:
+            vectorstore_manager.save_vectorstore()  # Keep it for the next process
+
         print(colored(f"Retriever created", 'green'))
         return vectorstore_manager
 
+    def create_vectorstore_manager(self, persist_dir=None):
+        return VectorStoreManager(
+            embedding_model=self.embedding_model,
+            persist_dir=persist_dir,
+            index_type=self.index_type,
+            search_kwargs=self.search_kwargs,
+            lexical_k=self.lexical_k,
+            fused_k=self.fused_k,
+            quantization=self.quantization,
+        )
+
+    def build_retriever(self, file_path, file_hash):
+        persist_dir = get_persist_dir(file_hash, self.embedding_model)
+        vectorstore_manager = self.create_vectorstore_manager(persist_dir)
+        # A document with pending tables or images still gets vectors added, so it is not mmap-ed
+        has_pending = os.path.exists(os.path.join(persist_dir, PENDING_MODALITIES_FILE))
+        # Open the already ingested document, otherwise build the vector store
+        if not vectorstore_manager.load_vectorstore(mmap=not has_pending):
+            vectorstore_manager = self.pdf_extraction_tool(
+                file_path=file_path, persist_dir=persist_dir, file_hash=file_hash
+            )
+        elif has_pending:
+            self.start_lazy_ingestion(LazyIngestion.load(self, vectorstore_manager, file_hash))
+        retriever = vectorstore_manager.get_runnable_retriever()
+        return retriever, vectorstore_manager.estimate_memory_footprint()
+
+    def get_corpus_manager(self):
+        """
+        Returns the process-wide vectorstore shared by all uploaded documents,
+        loading it from disk or creating it on first use. Must be called under _corpus_lock.
+        """
+        vectorstore_manager = _corpus_managers.get(self.embedding_model)
+        if vectorstore_manager is None:
+            vectorstore_manager = self.create_vectorstore_manager(get_corpus_dir(embedding_model=self.embedding_model))
+            # Not mmap-ed, documents are added to and removed from the index
+            if not vectorstore_manager.load_vectorstore(mmap=False):
+                vectorstore_manager.create_vectorstore()
+            _corpus_managers[self.embedding_model] = vectorstore_manager
+        return vectorstore_manager
+
+    def build_corpus_retriever(self, file_paths):
+        """
+        Adds the PDFs missing from the shared corpus, ingesting several at
+        once, and returns a retriever restricted to the given documents.
+        """
+        file_hashes = {get_file_hash(file_path): file_path for file_path in file_paths}
+        with _corpus_lock:
+            vectorstore_manager = self.get_corpus_manager()
+            known = vectorstore_manager.list_documents()
+            missing = {file_hash: path for file_hash, path in file_hashes.items() if file_hash not in known}
+            if missing:
+                print(colored(f"Ingesting {len(missing)} of {len(file_hashes)} documents into the corpus", 'cyan'))
+                # Revisions of documents already in the corpus only add their changed pages
+                pages = {}
+                if self.incremental:
+                    candidates = known - file_hashes.keys()
+                    for file_hash, path in missing.items():
+                        pages[file_hash] = self.apply_revision(vectorstore_manager, path, file_hash, candidates)
+                add_lock = threading.Lock()
+                with ThreadPoolExecutor(max_workers=min(len(missing), self.ingest_workers)) as executor:
+                    futures = [
+                        executor.submit(
+                            self.ingest_pdf, vectorstore_manager, path, file_hash, add_lock, pages=pages.get(file_hash)
+                        )
+                        for file_hash, path in missing.items()
+                    ]
+                    for future in futures:
+                        future.result()
+                vectorstore_manager.build_ann_index()
+                vectorstore_manager.save_vectorstore()
+        return vectorstore_manager.get_runnable_retriever(source_ids=list(file_hashes))
+
+    def apply_revision(self, vectorstore_manager, file_path, file_hash, candidates):
+        """
+        Finds the corpus document file_path is a revision of, by shared page hashes.
+        The vectors of its changed and removed pages are deleted, the rest are
+        moved to the new document. Returns the pages of the new document that
+        still have to be ingested, None if it is not a revision.
+        """
+        new_hashes = self.get_page_hashes(file_path, file_hash)
+        previous, old_hashes, shared = None, None, 0
+        for candidate in candidates:
+            candidate_hashes = artifact_cache.get("page_hashes", candidate)
+            if candidate_hashes is None:
+                continue
+            candidate_shared = len(set(candidate_hashes) & set(new_hashes))
+            if candidate_shared > shared:
+                previous, old_hashes, shared = candidate, candidate_hashes, candidate_shared
+        if previous is None or shared < len(new_hashes) * REVISION_MIN_SHARED_PAGES:
+            return None
+        candidates.discard(previous)  # A document is the previous version of one upload only
+
+        # Map every unchanged old page to the same content in the new revision
+        new_positions = {}
+        for page_number, page_hash in enumerate(new_hashes, start=1):
+            new_positions.setdefault(page_hash, []).append(page_number)
+        page_map = {}
+        for page_number, page_hash in enumerate(old_hashes, start=1):
+            if new_positions.get(page_hash):
+                page_map[page_number] = new_positions[page_hash].pop(0)
+        changed_pages = set(range(1, len(old_hashes) + 1)) - page_map.keys()
+
+        # Chunks spanning a changed page are dropped with all chunks on their pages, which are ingested
+        # again. The partition is cached, ingest_pdf gets the same chunks
+        new_spans = [get_page_numbers(chunk) for chunk in self.extract_pdf_elements(file_path, file_hash)]
+        pages = vectorstore_manager.revise_document(
+            previous, file_hash, page_map, changed_pages, len(new_hashes), new_spans
+        )
+        print(colored(
+            f"Revision of {previous[:12]}: {len(changed_pages)} pages changed or removed, "
+            f"{len(pages)} of {len(new_hashes)} pages to ingest",
+            'cyan',
+        ))
+        return pages
+
+    def remove_from_corpus(self, file_path):
+        """
+        Removes one document from the shared corpus without re-ingesting the others.
+        """
+        with _corpus_lock:
+            vectorstore_manager = self.get_corpus_manager()
+            if vectorstore_manager.remove_document(get_file_hash(file_path)):
+                vectorstore_manager.save_vectorstore()
+
     def create_retriever(self, file_path=None):
+        # Several uploads are searched together in the shared corpus
+        if isinstance(file_path, (list, tuple)):
+            if len(file_path) <= 1:
+                file_path = file_path[0] if file_path else None
+            elif self.retriever is None:
+                self.retriever = self.build_corpus_retriever(file_path)
+                print("PDFReporter Agent: Corpus retriever created")
+                return self.retriever
+
         if self.retriever is None and file_path is not None:
-            vectorstore_manager = self.pdf_extraction_tool(file_path=file_path)  # Build vector store
-            self.retriever = vectorstore_manager.get_runnable_retriever()
+            # Reuse the retriever built for the same file content and embedding model
+            file_hash = get_file_hash(file_path)
+            key = retriever_registry.make_key(file_hash, self.embedding_model)
+            self.retriever = retriever_registry.get_or_create(key, lambda: self.build_retriever(file_path, file_hash))
+            self.lazy_ingestion = _lazy_ingestions.get(file_hash)
             print("PDFReporter Agent: Retriever created")
             return self.retriever
         elif self.retriever is not None and file_path is not None:
@@ -161,45 +768,87 @@ class PDFReporterAgent(Agent):
         else:
             print("Retriever has not been created. Please run create_vectorstore() first.")
         
+    def retrieve(self, question):
+        """
+        Runs the retriever. For a lazily ingested document the pending tables and
+        images next to the hits are indexed first, then the retrieval is repeated
+        so the question sees them.
+        """
+        lazy_ingestion = self.lazy_ingestion
+        if lazy_ingestion is None or lazy_ingestion.done:
+            return self.retriever.invoke(question)
+
+        with lazy_ingestion.lock:
+            docs = self.retriever.invoke(question)
+        if self.lazy_modalities == "on_demand" and lazy_ingestion.ingest_hits([as_entry(doc) for doc in docs]):
+            with lazy_ingestion.lock:
+                docs = self.retriever.invoke(question)
+        return docs
+
     def parse_docs(self, docs):
-        """Split base64-encoded images and texts"""
-        b64 = []
-        text = []
+        """Split texts, tables and images by the modality tag of their docstore entry"""
+        docs_by_type = {"texts": [], "tables": [], "images": [], "ranked": []}
         for doc in docs:
-            try:
-                b64decode(doc)
-                b64.append(doc)
-            except Exception as e:
-                text.append(doc)
-        return {"images": b64, "texts": text}
+            entry = as_entry(doc)
+            docs_by_type[entry.modality + "s"].append(entry)
+            docs_by_type["ranked"].append(entry)  # Retrieval order, used for packing
+        return docs_by_type
 
     def build_prompt(self, kwargs):
 
         docs_by_type = kwargs["context"]
         user_question = kwargs["question"]
 
-        context_text = ""
-        if len(docs_by_type["texts"]) > 0:
-            for text_element in docs_by_type["texts"]:
-                context_text += text_element.text
+        current_datetime = get_current_utc_datetime()
+        model_name = self.model or "gpt-3.5-turbo"
+
+        # Fill the token budget in relevance order, the prompt itself is reserved first
+        empty_prompt = pdf_reporter_prompt_template.format(
+            question=user_question, context_text="", datetime=current_datetime
+        )
+        reserved_tokens = count_tokens(empty_prompt, model_name)
+        self.table_answer = None
+        if self.table_query_engine is not None and docs_by_type["tables"]:
+            self.table_answer = self.table_query_engine.answer(user_question, docs_by_type["tables"])
+
+        # The computed answer goes first, the retrieved context is still packed after it
+        table_texts = []
+        if self.table_answer is not None:
+            table_texts = [self.table_answer.text]
+            slice_tokens = count_tokens(table_texts[0], model_name)
+            reserved_tokens += slice_tokens
+            print(colored(
+                f"Table fast path: {self.table_answer.operation} of '{self.table_answer.column}' = "
+                f"{format_number(self.table_answer.value)} ({slice_tokens} context tokens)",
+                'green',
+            ))
+        packer = ContextPacker(self.context_token_budget, model_name)
+        # Image bytes are read from the blob store only now, hot images come from its LRU cache
+        docstore = getattr(self.retriever, "docstore", None)
+        context_texts, images, self.context_report = packer.pack(
+            docs_by_type["ranked"],
+            reserved_tokens=reserved_tokens,
+            load_image=lambda entry: entry.load(docstore),
+        )
+        context_texts = table_texts + context_texts
+        self.context_report["table_answer"] = self.table_answer
 
         # construct prompt with context (including images)
         prompt_template = pdf_reporter_prompt_template.format(
                                                             question=user_question,
-                                                            context_text=context_text,
-                                                            datetime=get_current_utc_datetime()
+                                                            context_text="\n\n".join(context_texts),
+                                                            datetime=current_datetime
                                                             )
 
         prompt_content = [{"type": "text", "text": prompt_template}]
 
-        if len(docs_by_type["images"]) > 0:
-            for image in docs_by_type["images"]:
-                prompt_content.append(
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image}"},
-                    }
-                )
+        for image in images:
+            prompt_content.append(
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image}"},
+                }
+            )
 
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -223,7 +872,7 @@ class PDFReporterAgent(Agent):
         # Chain setup with context, processing, and final response retrieval
             chain = (
                 {
-                    "context": retriever | RunnableLambda(self.parse_docs),  # Make retriever compatible using .as_retriever()
+                    "context": RunnableLambda(self.retrieve) | RunnableLambda(self.parse_docs),  # Retrieval, indexing lazy modalities on the way
                     "question": RunnablePassthrough(),
                 }
                 # | RunnableLambda(self.debug_input)  # Debuging
@@ -113,28 +113,28 @@ def main():
     with st.sidebar:
         st.header("Application settings")
         ### PDF ###
-        with st.expander("Upload your PDF file"):
+        with st.expander("Upload your PDF files"):
             # Define header
             st.subheader("Your documents")
-            # create a temporary file
-            tmp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
             # File Uploader on the sidebar
-            pdf_doc = st.file_uploader(
-                "Choose a PDF file", type="pdf", accept_multiple_files=False,
+            pdf_docs = st.file_uploader(
+                "Choose PDF files", type="pdf", accept_multiple_files=True,
             )
 
-            # Create the button to upload the file
+            # Create the button to upload the files
             if st.button("Upload PDF"):
                 with st.spinner("Uploading PDF..."):
                     try:
-                        if pdf_doc is not None:
-                            # Save the PDF file temporarily
-                            tmp_file.write(pdf_doc.getvalue())
-                            tmp_file.flush()
-                            # Pass the path of the temporary file to session state
-                            st.session_state.pdf_loaded = tmp_file.name
-                            tmp_file.close()
-                            st.success("PDF uploaded successfully", icon="✅")
+                        pdf_paths = []
+                        for pdf_doc in pdf_docs or []:
+                            # Save every PDF file temporarily
+                            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
+                                tmp_file.write(pdf_doc.getvalue())
+                            pdf_paths.append(tmp_file.name)
+                        if pdf_paths:
+                            # Pass the paths of the temporary files to session state
+                            st.session_state.pdf_loaded = pdf_paths
+                            st.success(f"{len(pdf_paths)} PDF file(s) uploaded successfully", icon="✅")
                     except Exception as e:
                         st.error("PDF upload failed", icon="❌")
 
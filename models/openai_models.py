@@ -6,18 +6,26 @@ config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.ya
 load_config(config_path)
 
 
-def get_open_ai(temperature=0, model='gpt-3.5-turbo'):
+# Retries of the OpenAI client itself, callers with their own retry loop pass 0
+DEFAULT_MAX_RETRIES = 2
+
+
+def get_open_ai(temperature=0, model='gpt-3.5-turbo', max_retries=DEFAULT_MAX_RETRIES, include_response_headers=False):
 
     llm = ChatOpenAI(
     model=model,
     temperature = temperature,
+    max_retries=max_retries,
+    include_response_headers=include_response_headers,
 )
     return llm
 
-def get_open_ai_json(temperature=0, model='gpt-3.5-turbo'):
+def get_open_ai_json(temperature=0, model='gpt-3.5-turbo', max_retries=DEFAULT_MAX_RETRIES, include_response_headers=False):
     llm = ChatOpenAI(
     model=model,
     temperature = temperature,
+    max_retries=max_retries,
+    include_response_headers=include_response_headers,
     model_kwargs={"response_format": {"type": "json_object"}},
 )
     return llm
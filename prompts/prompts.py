@@ -4,7 +4,8 @@ Questions may vary from simple to complex, multi-step queries. Your plan should
 team to use an internet search engine effectively.
 
 Focus on highlighting the most relevant search term to start with, as another team member will use your suggestions 
-to search for relevant information.
+to search for relevant information. You may add up to 3 complementary search terms covering other aspects of the 
+question, they are searched at the same time.
 
 If you receive feedback, you must adjust your plan accordingly. Here is the feedback received:
 Feedback: {feedback}
@@ -15,6 +16,7 @@ Current date and time:
 Your response must take the following json format:
 
     "search_term": "The most relevant search term to start with"
+    "search_terms": ["Up to 3 complementary search terms, most relevant first, or an empty list"]
     "overall_strategy": "The overall strategy to guide the search process"
     "additional_information": "Any additional information to guide the search including other search terms or filters"
 
@@ -27,6 +29,12 @@ planner_guided_json = {
             "type": "string",
             "description": "The most relevant search term to start with"
         },
+        "search_terms": {
+            "type": "array",
+            "items": {"type": "string"},
+            "maxItems": 3,
+            "description": "Up to 3 complementary search terms, most relevant first, searched along with search_term"
+        },
         "overall_strategy": {
             "type": "string",
             "description": "The overall strategy to guide the search process"
@@ -36,14 +44,14 @@ planner_guided_json = {
             "description": "Any additional information to guide the search including other search terms or filters"
         }
     },
-    "required": ["search_term", "overall_strategy", "additional_information"]
+    "required": ["search_term", "search_terms", "overall_strategy", "additional_information"]
 }
 
 
 selector_prompt_template = """
 You are a selector. You will be presented with a search engine results page containing a list of potentially relevant 
 search results. Your task is to read through these results, select the most relevant one, and provide a comprehensive 
-reason for your selection.
+reason for your selection. Also rank up to 5 relevant pages, the top ones are read at the same time.
 
 here is the search engine results page:
 {serp}
@@ -51,6 +59,7 @@ here is the search engine results page:
 Return your findings in the following json format:
 
     "selected_page_url": "The exact URL of the page you selected",
+    "selected_page_urls": ["The exact URLs of up to 5 relevant pages, most relevant first"],
     "description": "A brief description of the page",
     "reason_for_selection": "Why you selected this page"
 
@@ -73,6 +82,12 @@ selector_guided_json = {
             "type": "string",
             "description": "The exact URL of the page you selected"
         },
+        "selected_page_urls": {
+            "type": "array",
+            "items": {"type": "string"},
+            "maxItems": 5,
+            "description": "The exact URLs of up to 5 relevant pages, most relevant first"
+        },
         "description": {
             "type": "string",
             "description": "A brief description of the page"
@@ -82,16 +97,18 @@ selector_guided_json = {
             "description": "Why you selected this page"
         }
     },
-    "required": ["selected_page_url", "description", "reason_for_selection"]
+    "required": ["selected_page_url", "selected_page_urls", "description", "reason_for_selection"]
 }
 
 
 reporter_prompt_template = """
-You are a reporter. You will be presented with a webpage containing information relevant to the research question. 
-Your task is to provide a comprehensive answer to the research question based on the information found on the page. 
+You are a reporter. You will be presented with one or more webpages containing information relevant to the research question. 
+Your task is to provide a comprehensive answer to the research question based on the information found on the pages. 
 Ensure to cite and reference your sources.
 
-The research will be presented as a dictionary with the source as a URL and the content as the text on the page:
+The research will be presented as a dictionary with the source as a URL and the content as the text on the page, 
+or as a list of such dictionaries if several pages were read. The content holds the passages of the page most 
+relevant to the question, "passages" gives their [start, end] character offsets in the page's main text:
 Research: {research}
 
 Structure your response as follows:
@@ -329,6 +346,22 @@ pdf_image_summary_guided_json = {
     "required": ["image_summary"]
 }
 
+pdf_packed_summary_prompt_template = """
+You are a summarizer. Your task is to summarize each of the {chunk_count} chunks (texts or tables) extracted from a PDF file separately.
+For every chunk you should provide a summary that is concise and clear, highlighting the main points and key information.
+Do not merge chunks and do not skip any chunk.
+
+Here are the chunks:
+{extracted_chunks}
+
+You must provide your response in the following json format, with exactly one entry per chunk in the given order:
+
+    "summaries": [
+        {{"chunk": 1, "summary": "The summary of chunk 1"}},
+        {{"chunk": 2, "summary": "The summary of chunk 2"}}
+    ]
+"""
+
 pdf_reporter_prompt_template = """
 Answer the question based only on the following context, which can include text and the below image(s).
 Context: {context_text}
@@ -1,4 +1,4 @@
-from typing import TypedDict, Annotated
+from typing import TypedDict, Annotated, List, Union
 from langgraph.graph.message import add_messages
 
 # Define the state object for the agent graph
@@ -12,7 +12,7 @@ class AgentGraphState(TypedDict):
     router_response: Annotated[list, add_messages]
     serper_response: Annotated[list, add_messages]
     scraper_response: Annotated[list, add_messages]
-    pdf_loaded: str
+    pdf_loaded: Union[str, List[str]]
     pdf_report_response: Annotated[list, add_messages]
     final_reports: Annotated[list, add_messages]
     end_chain: Annotated[list, add_messages]
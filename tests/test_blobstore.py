@@ -0,0 +1,82 @@
+import os
+import base64
+import hashlib
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import tools.table_format as table_format
+from tests.test_vectorstore_revision import FakeEmbeddings
+from tools.table_format import CompactTable
+from vectorstore.blobstore import BlobStore, ReferenceCounts, REFERENCES_FILE, blob_store
+from vectorstore.vectorstore import VectorStoreManager
+
+
+class BlobStoreReferenceTest(unittest.TestCase):
+    def setUp(self):
+        self.store = BlobStore(tempfile.mkdtemp())
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        handle = self.store.put(b"image bytes")
+        self.assertEqual(self.store.put(b"image bytes"), handle)
+        self.assertEqual(self.store.release(handle), 1)
+        self.assertEqual(self.store.get(handle), b"image bytes")
+        self.assertEqual(self.store.release(handle), 0)
+        self.assertIsNone(self.store.get(handle))
+
+    def test_uncounted_blob_is_kept(self):
+        handle = self.store.put(b"stored before counting")
+        os.remove(os.path.join(self.store.root, REFERENCES_FILE))
+        self.store.references = ReferenceCounts(os.path.join(self.store.root, REFERENCES_FILE))
+        self.assertIsNone(self.store.release(handle))
+        self.assertEqual(self.store.get(handle), b"stored before counting")
+
+
+class RemoveEntriesTest(unittest.TestCase):
+    def setUp(self):
+        blob_root, table_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        patchers = [
+            mock.patch("vectorstore.vectorstore.CachedEmbeddings", lambda model: FakeEmbeddings()),
+            mock.patch.object(blob_store, "root", blob_root),
+            mock.patch.object(blob_store, "references", ReferenceCounts(os.path.join(blob_root, REFERENCES_FILE))),
+            mock.patch.object(
+                table_format, "table_references", ReferenceCounts(os.path.join(table_root, REFERENCES_FILE))
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.table_path = os.path.join(table_root, "cells.parquet")
+        with open(self.table_path, "wb") as file:
+            file.write(b"cells")
+        self.manager = VectorStoreManager(embedding_model="fake-embedding", lexical_k=0)
+        self.manager.create_vectorstore()
+
+    def add_document(self, source_id, image):
+        table = CompactTable([["Region", "Sales"], ["North", "10"]], metadata=SimpleNamespace(page_number=1),
+                             data_path=self.table_path)
+        self.manager.add_elements([image, table], [f"{source_id} image", f"{source_id} table"], [source_id] * 2)
+
+    def test_files_are_deleted_with_the_last_document_using_them(self):
+        shared = base64.b64encode(b"logo").decode("ascii")
+        own = base64.b64encode(b"chart").decode("ascii")
+        self.add_document("a", shared)
+        self.add_document("b", shared)
+        self.add_document("c", own)
+        shared_path = blob_store._path(hashlib.sha256(b"logo").hexdigest())
+        own_path = blob_store._path(hashlib.sha256(b"chart").hexdigest())
+        self.assertTrue(os.path.exists(own_path))
+
+        self.manager.remove_document("c")
+        self.assertFalse(os.path.exists(own_path))
+        self.manager.remove_document("a")
+        self.assertTrue(os.path.exists(shared_path))
+        self.assertTrue(os.path.exists(self.table_path))
+        self.manager.remove_document("b")
+        self.assertFalse(os.path.exists(shared_path))
+        self.assertFalse(os.path.exists(self.table_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from tools.table_format import CompactTable, parse_html_table, parse_number
+
+
+class ParseHtmlTableTest(unittest.TestCase):
+    def test_rowspan_and_colspan_header(self):
+        html = (
+            "<table>"
+            "<tr><th rowspan=2>Segment</th><th colspan=2>Revenue</th></tr>"
+            "<tr><th>Q2</th><th>Q3</th></tr>"
+            "<tr><td>Cloud</td><td>120</td><td>135</td></tr>"
+            "</table>"
+        )
+        rows, header_rows = parse_html_table(html)
+        self.assertEqual(header_rows, 2)
+        self.assertEqual(rows[2], ["Cloud", "120", "135"])
+        table = CompactTable(rows, header_rows)
+        self.assertEqual(table.header, ["Segment", "Revenue Q2", "Revenue Q3"])
+        self.assertEqual(table.column_types, ["text", "number", "number"])
+
+    def test_rowspan_in_body(self):
+        html = (
+            "<table>"
+            "<tr><th>Region</th><th>Quarter</th><th>Sales</th></tr>"
+            "<tr><td rowspan=2>North</td><td>Q1</td><td>10</td></tr>"
+            "<tr><td>Q2</td><td>12</td></tr>"
+            "<tr><td>South</td><td>Q1</td><td rowspan=2>8</td></tr>"
+            "<tr><td>South</td><td>Q2</td></tr>"
+            "</table>"
+        )
+        rows, _ = parse_html_table(html)
+        self.assertEqual(rows[1:], [
+            ["North", "Q1", "10"],
+            ["North", "Q2", "12"],
+            ["South", "Q1", "8"],
+            ["South", "Q2", "8"],
+        ])
+
+    def test_rowspan_past_short_row(self):
+        html = "<table><tr><td>a</td><td>b</td><td rowspan=2>c</td></tr><tr><td>d</td></tr></table>"
+        rows, _ = parse_html_table(html)
+        self.assertEqual(rows, [["a", "b", "c"], ["d", "", "c"]])
+
+
+class ParseNumberTest(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(parse_number("$1,200.50"), 1200.5)
+        self.assertEqual(parse_number("(450)"), -450)
+        self.assertEqual(parse_number("-3.4%"), -3.4)
+        self.assertIsNone(parse_number("Q3"))
+        self.assertIsNone(parse_number("(450"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+from tests.test_vectorstore_revision import FakeEmbeddings
+from vectorstore.vectorstore import VectorStoreManager
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+class BuildAnnIndexTest(unittest.TestCase):
+    def make_manager(self, index_type, quantization=None):
+        with mock.patch("vectorstore.vectorstore.CachedEmbeddings", lambda model: CountingEmbeddings()):
+            manager = VectorStoreManager(
+                embedding_model="fake-embedding", index_type=index_type, quantization=quantization, lexical_k=0
+            )
+            manager.create_vectorstore()
+        texts = [f"summary {i}" for i in range(800)]
+        manager.add_elements(texts, texts)
+        return manager
+
+    def test_ivf_pq_is_built_once_without_embedding_again(self):
+        for index_type, quantization in (("ivf_pq", None), ("ivf_flat", "pq"), ("hnsw", "int8")):
+            with self.subTest(index_type=index_type, quantization=quantization):
+                manager = self.make_manager(index_type, quantization)
+                embeddings = manager.vectorstore.embedding_function
+                manager.build_ann_index()
+                index = manager.vectorstore.index
+                embedded = embeddings.embedded
+                manager.build_ann_index()
+                manager.build_ann_index()
+                self.assertIs(manager.vectorstore.index, index)
+                self.assertEqual(embeddings.embedded, embedded)
+                self.assertEqual(len(manager.vectorstore.full_vectors.get_all()), 800)
+
+    def test_rebuild_reads_the_full_vectors(self):
+        manager = self.make_manager("ivf_pq")
+        embeddings = manager.vectorstore.embedding_function
+        manager.build_ann_index()
+        embedded = embeddings.embedded
+        manager.index_type = "hnsw"
+        manager.build_ann_index()
+        self.assertEqual(embeddings.embedded, embedded)
+
+
+if __name__ == "__main__":
+    unittest.main()
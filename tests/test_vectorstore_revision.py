@@ -0,0 +1,82 @@
+import unittest
+from collections import Counter
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from vectorstore.vectorstore import VectorStoreManager, get_page_numbers
+
+
+class FakeEmbeddings(Embeddings):
+    hit_rate = 0.0
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(sum(map(ord, text))).normal(size=8).tolist()
+
+
+def make_chunk(text, *page_numbers):
+    orig_elements = [SimpleNamespace(metadata=SimpleNamespace(page_number=page)) for page in page_numbers]
+    return SimpleNamespace(text=text, metadata=SimpleNamespace(page_number=page_numbers[0], orig_elements=orig_elements))
+
+
+class ReviseDocumentTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("vectorstore.vectorstore.CachedEmbeddings", lambda model: FakeEmbeddings())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = VectorStoreManager(embedding_model="fake-embedding", lexical_k=0)
+        self.manager.create_vectorstore()
+
+    def add(self, chunks, source_id):
+        self.manager.add_elements(chunks, [chunk.text for chunk in chunks], [source_id] * len(chunks))
+
+    def entries(self):
+        docs = self.manager.vectorstore.docstore._dict.values()
+        return Counter((doc.metadata["source_id"], tuple(doc.metadata["page_numbers"]), doc.page_content) for doc in docs)
+
+    def test_chunks_on_reingested_pages_are_stored_once(self):
+        self.add([
+            make_chunk("A page one", 1),
+            make_chunk("A pages one and two", 1, 2),
+            make_chunk("A page two", 2),
+            make_chunk("A page three", 3),
+        ], "v1")
+        # Page 1 changed, pages 2 and 3 are the same
+        revision = [
+            make_chunk("B page one", 1),
+            make_chunk("B pages one and two", 1, 2),
+            make_chunk("A page two", 2),
+            make_chunk("A page three", 3),
+        ]
+        pages = self.manager.revise_document(
+            "v1", "v2", {2: 2, 3: 3}, {1}, 3, [get_page_numbers(chunk) for chunk in revision]
+        )
+        self.assertEqual(pages, {1, 2})
+        self.add([chunk for chunk in revision if get_page_numbers(chunk) & pages], "v2")
+
+        entries = self.entries()
+        self.assertEqual(sum(entries.values()), 4)
+        self.assertEqual(max(entries.values()), 1)
+        self.assertIn(("v2", (2,), "A page two"), entries)
+        self.assertIn(("v2", (3,), "A page three"), entries)
+        self.assertEqual(self.manager.vectorstore.index.ntotal, 4)
+
+    def test_new_chunk_spanning_a_kept_page_grows_the_pages(self):
+        self.add([make_chunk("A page one", 1), make_chunk("A page two", 2), make_chunk("A page three", 3)], "v1")
+        # The changed first page now runs into the second one
+        revision = [make_chunk("B pages one and two", 1, 2), make_chunk("A page three", 3)]
+        pages = self.manager.revise_document(
+            "v1", "v2", {2: 2, 3: 3}, {1}, 3, [get_page_numbers(chunk) for chunk in revision]
+        )
+        self.assertEqual(pages, {1, 2})
+        self.add([chunk for chunk in revision if get_page_numbers(chunk) & pages], "v2")
+        self.assertEqual(sorted(text for _, _, text in self.entries()), ["A page three", "B pages one and two"])
+
+
+if __name__ == "__main__":
+    unittest.main()
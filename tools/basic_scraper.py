@@ -1,54 +1,179 @@
-import json 
-import requests
-from bs4 import BeautifulSoup
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+from termcolor import colored
 from states.state import AgentGraphState
 from langchain_core.messages import HumanMessage
+from tools.http_client import http_client
+from tools.google_serper import canonicalize_url
+from tools.html_extraction import extract_main_blocks
+from tools.passage_ranking import chunk_passages, select_passages, DEFAULT_PAGE_TOKEN_BUDGET
+
+# Pages of the selector's ranking fetched at most
+MAX_SCRAPED_PAGES = 3
+# Concurrent requests to the same host
+PER_HOST_CONCURRENCY = 2
+# Seconds to connect to a page and between two reads of its response
+SCRAPER_CONNECT_TIMEOUT = 5.0
+SCRAPER_READ_TIMEOUT = 10.0
+# Seconds for all pages, the pages not finished by then are dropped
+SCRAPE_DEADLINE = 20.0
+# Bytes of a response body read at most, the rest of the page is not downloaded (2 MiB)
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+# Responses declaring a larger body are downloads or dumps rather than pages, and are skipped (20 MiB)
+MAX_DECLARED_PAGE_BYTES = 20 * 1024 * 1024
+# Content types worth extracting text from, anything else (PDFs, images, archives) is skipped
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+# Tokens of the best passages of a page passed to the reporter
+PAGE_TOKEN_BUDGET = DEFAULT_PAGE_TOKEN_BUDGET
+
 
 def is_garbled(text):
     # A simple heuristic to detect garbled text: high proportion of non-ASCII characters
     non_ascii_count = sum(1 for char in text if ord(char) > 127)
     return non_ascii_count > len(text) * 0.3
 
+
+def get_selected_urls(research_data, max_pages=MAX_SCRAPED_PAGES):
+    """
+    URLs ranked by the selector, the top selected_page_url first, without duplicates.
+    """
+    urls = [research_data.get("selected_page_url")] + list(research_data.get("selected_page_urls") or [])
+    unique_urls = {}
+    for url in urls:
+        if isinstance(url, str) and url.strip():
+            unique_urls.setdefault(canonicalize_url(url), url.strip())
+    return list(unique_urls.values())[:max_pages]
+
+
+def extract_page_text(data, encoding=None, question=None):
+    """
+    Main content of a page, boilerplate removed, reduced to the passages that
+    best match question within PAGE_TOKEN_BUDGET. Returns the text, the
+    [start, end] character offsets of the passages and the main content
+    they point into.
+    """
+    main_text, passages = chunk_passages(extract_main_blocks(data, encoding))
+    passages = select_passages(passages, question, PAGE_TOKEN_BUDGET)
+    content = "\n\n".join(passage.text for passage in passages)
+    if not content:
+        return "error in scraping website, no text found", [], ""
+
+    # Check for garbled text
+    if is_garbled(content):
+        return "error in scraping website, garbled text returned", [], ""
+    return content, [[passage.start, passage.end] for passage in passages], main_text
+
+
+def get_content_type(response):
+    return response.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+async def read_capped(response, max_bytes=MAX_PAGE_BYTES):
+    """
+    Reads the body of a streamed response up to max_bytes, closing the stream after that.
+    """
+    body = bytearray()
+    async for chunk in response.aiter_bytes():
+        body += chunk
+        if len(body) >= max_bytes:
+            break
+    return bytes(body[:max_bytes])
+
+
+async def fetch_page(client, url, host_limits, question=None):
+    """
+    Streams url within the limit of its host. Returns whether it succeeded,
+    its passages for question (or an error message), their offsets and the
+    main content of the page. Non-text and oversized responses are skipped
+    from their headers, before the body is downloaded, and at most
+    MAX_PAGE_BYTES are read.
+    """
+    host = urlsplit(url).netloc.lower()
+    try:
+        async with host_limits.setdefault(host, asyncio.Semaphore(PER_HOST_CONCURRENCY)):
+            async with client.stream(
+                "GET", url, timeout=httpx.Timeout(SCRAPER_READ_TIMEOUT, connect=SCRAPER_CONNECT_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                content_type = get_content_type(response)
+                if content_type and not content_type.startswith(TEXT_CONTENT_TYPES):
+                    return False, f"error in scraping website, skipped {content_type} content at {url}", [], ""
+                content_length = response.headers.get("content-length", "")
+                if content_length.isdigit() and int(content_length) > MAX_DECLARED_PAGE_BYTES:
+                    return False, f"error in scraping website, skipped {int(content_length)} byte response at {url}", [], ""
+                data = await read_capped(response)
+                encoding = response.charset_encoding
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
+            return False, f"error in scraping website, 403 Forbidden for url: {url}", [], ""
+        return False, f"error in scraping website, {str(e)}", [], ""
+    except httpx.HTTPError as e:
+        return False, f"error in scraping website, {type(e).__name__}: {str(e)}", [], ""
+    if not content_type and b"\x00" in data[:1024]:  # No declared type and binary bytes
+        return False, f"error in scraping website, skipped binary content at {url}", [], ""
+    # Parsing runs in a worker thread, so it does not hold up the other downloads
+    content, offsets, main_text = await asyncio.to_thread(extract_page_text, data, encoding, question)
+    return bool(offsets), content, offsets, main_text
+
+
+async def scrape_pages(urls, question=None, deadline=SCRAPE_DEADLINE):
+    """
+    Fetches urls concurrently over the pooled client. Returns (url, ok, content,
+    offsets, main text) of the pages finished within deadline seconds, in rank order.
+    """
+    client = http_client.client
+    host_limits = {}
+    tasks = [asyncio.ensure_future(fetch_page(client, url, host_limits, question)) for url in urls]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    pages = []
+    for url, task in zip(urls, tasks):
+        if task in done and not task.cancelled() and task.exception() is None:
+            pages.append((url, *task.result()))
+        elif task in done:
+            pages.append((url, False, f"error in scraping website, {task.exception()}", [], ""))
+    return pages
+
+
 def scrape_website(state: AgentGraphState, research=None):
     research_data = research().content
     research_data = json.loads(research_data)
     # research_data = ast.literal_eval(research_data)
 
-    try:
-        url = research_data["selected_page_url"]
-    except KeyError as e:
-        url = research_data["error"]
-
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract text content
-        texts = soup.stripped_strings
-        content = ' '.join(texts)
-        
-        # Check for garbled text
-        if is_garbled(content):
-            content = "error in scraping website, garbled text returned"
-        else:
-            # Limit the content to 4000 characters
-            content = content[:4000]
-
-        state["scraper_response"].append(HumanMessage(role="system", content=str({"source": url, "content": content})))
-        
-        return {"scraper_response": state["scraper_response"]}
-    
-    except requests.HTTPError as e:
-        if e.response.status_code == 403:
-            content = f"error in scraping website, 403 Forbidden for url: {url}"
-        else:
-            content = f"error in scraping website, {str(e)}"
-        
-        state["scraper_response"].append(HumanMessage(role="system", content=str({"source": url, "content": content})))
-        return {"scraper_response": state["scraper_response"]}
-    except requests.RequestException as e:
-        content = f"error in scraping website, {str(e)}"
+    urls = get_selected_urls(research_data)
+    if not urls:
+        url = research_data.get("error")
+        content = f"error in scraping website, no page selected: {url}"
         state["scraper_response"].append(HumanMessage(role="system", content=str({"source": url, "content": content})))
         return {"scraper_response": state["scraper_response"]}
 
+    started = time.perf_counter()
+    pages = http_client.run(scrape_pages(urls, state.get("research_question")))
+    # The offsets locate every passage in the main content of the page, for citations
+    scraped = [
+        {"source": url, "content": content, "passages": offsets} for url, ok, content, offsets, _ in pages if ok
+    ]
+    # The main contents ride along on the message, outside of the text sent to the reporter
+    main_texts = {url: main_text for url, ok, _, _, main_text in pages if ok}
+    print(colored(
+        f"Scraper: {len(scraped)}/{len(urls)} pages in {time.perf_counter() - started:.2f}s "
+        f"({len(urls) - len(pages)} past the {SCRAPE_DEADLINE:.0f}s deadline)",
+        'cyan',
+    ))
+
+    # Only the pages that made it go to the reporter, the errors if none did
+    if not scraped:
+        scraped = [{"source": url, "content": content} for url, _, content, _, _ in pages]
+    if not scraped:
+        scraped = [{"source": url, "content": f"error in scraping website, no response within {SCRAPE_DEADLINE:.0f}s"}
+                   for url in urls]
+    research = scraped[0] if len(scraped) == 1 else scraped
+    state["scraper_response"].append(HumanMessage(
+        role="system", content=str(research), additional_kwargs={"main_texts": main_texts}
+    ))
+    return {"scraper_response": state["scraper_response"]}
@@ -0,0 +1,127 @@
+import io
+import re
+import math
+import base64
+import binascii
+
+from PIL import Image, UnidentifiedImageError
+from termcolor import colored
+
+from tools.summary_scheduler import count_tokens, get_encoding, IMAGE_TOKEN_ESTIMATE
+
+# Tokens of retrieved context (text, tables and images) allowed in one prompt
+DEFAULT_CONTEXT_TOKEN_BUDGET = 8000
+# A truncated chunk is only kept if at least this many tokens of it fit
+MIN_TRUNCATED_TOKENS = 50
+
+# OpenAI vision pricing: images are fitted into 2048x2048, scaled so the short
+# side is at most 768 and billed per 512px tile on top of a base cost
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+IMAGE_TILE_SIZE = 512
+IMAGE_MAX_SIDE = 2048
+IMAGE_SHORT_SIDE = 768
+
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def image_tokens(width, height, detail="high"):
+    """
+    Tokens billed for an image of width x height pixels.
+    """
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    scale = min(1.0, IMAGE_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, IMAGE_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def estimate_image_tokens(image_base64, detail="high"):
+    # Only the image header is parsed to read its size
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(image_base64))) as image:
+            return image_tokens(*image.size, detail=detail)
+    except (binascii.Error, ValueError, UnidentifiedImageError, OSError):
+        return IMAGE_TOKEN_ESTIMATE
+
+
+def truncate_to_sentences(text, max_tokens, model_name="gpt-3.5-turbo"):
+    """
+    Returns the longest prefix of whole sentences of text within max_tokens.
+    """
+    encoding = get_encoding(model_name)
+    kept = []
+    used = 0
+    position = 0
+    for match in list(SENTENCE_END_PATTERN.finditer(text)) + [None]:
+        end = match.end() if match else len(text)
+        sentence = text[position:end]
+        tokens = len(encoding.encode(sentence, disallowed_special=()))
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+        position = end
+    return "".join(kept).rstrip()
+
+
+class ContextPacker:
+    def __init__(self, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET, model_name="gpt-3.5-turbo",
+                 image_detail="high", min_truncated_tokens=MIN_TRUNCATED_TOKENS):
+        """
+        Fills a token budget with retrieved entries in relevance order. Texts
+        that do not fit are cut at a sentence boundary, images that do not fit
+        are dropped.
+        """
+        self.token_budget = token_budget
+        self.model_name = model_name
+        self.image_detail = image_detail
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def pack(self, entries, reserved_tokens=0, load_image=None):
+        """
+        entries are DocEntry values, most relevant first. load_image(entry)
+        returns the base64 payload of an image entry.
+        Returns the context texts, the images and a report of the packing.
+        """
+        remaining = self.token_budget - reserved_tokens
+        texts = []
+        images = []
+        report = {"budget": self.token_budget, "used_tokens": reserved_tokens, "truncated": [], "dropped": []}
+
+        for rank, entry in enumerate(entries):
+            if entry.modality == "image":
+                image = load_image(entry) if load_image is not None else entry.content
+                tokens = estimate_image_tokens(image, self.image_detail) if image else 0
+                if not image or tokens > remaining:
+                    report["dropped"].append({"rank": rank, "modality": "image", "tokens": tokens})
+                    continue
+                images.append(image)
+            else:
+                text = entry.text
+                tokens = count_tokens(text, self.model_name)
+                if tokens > remaining:
+                    truncated = ""
+                    if remaining >= self.min_truncated_tokens:
+                        truncated = truncate_to_sentences(text, remaining, self.model_name)
+                    if not truncated:
+                        report["dropped"].append({"rank": rank, "modality": entry.modality, "tokens": tokens})
+                        continue
+                    report["truncated"].append({"rank": rank, "modality": entry.modality, "tokens": tokens})
+                    text = truncated
+                    tokens = count_tokens(text, self.model_name)
+                texts.append(text)
+            remaining -= tokens
+            report["used_tokens"] += tokens
+
+        if report["dropped"] or report["truncated"]:
+            print(colored(
+                f"Context packing: {report['used_tokens']}/{self.token_budget} tokens, "
+                f"{len(report['truncated'])} truncated, {len(report['dropped'])} dropped "
+                f"(ranks {[item['rank'] for item in report['dropped']]})",
+                'yellow',
+            ))
+        return texts, images, report
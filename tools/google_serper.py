@@ -1,13 +1,53 @@
 import os
-import ast
-import requests
 import json
-from langchain_community.utilities import GoogleSerperAPIWrapper
+import time
+import asyncio
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+from termcolor import colored
 from utils.helper_functions import load_config
 from states.state import AgentGraphState
+from tools.http_client import http_client
+from tools.search_cache import search_cache, FRESH, STALE
 
 config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
 
+SERPER_SEARCH_URL = "https://google.serper.dev/search"
+# Country, language and number of results of every search, unless SERPER_COUNTRY,
+# SERPER_LANGUAGE or SERPER_NUM_RESULTS are set in the environment or config.yaml
+DEFAULT_SERPER_COUNTRY = "us"
+DEFAULT_SERPER_LANGUAGE = "en"
+DEFAULT_SERPER_NUM_RESULTS = 10
+# Search terms of one plan queried at most
+MAX_SEARCH_TERMS = 4
+# Wall-clock limit of one search request in seconds, on top of the client connect/read timeouts
+SERPER_REQUEST_TIMEOUT = 15.0
+# Query parameters that only track the visit and do not change the page, matched by
+# their exact name, and the prefixes of tracking parameter families
+TRACKING_PARAMETERS = frozenset(("gclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src"))
+TRACKING_PARAMETER_PREFIXES = ("utm_",)
+
+
+@lru_cache(maxsize=None)
+def load_serper_config():
+    # config.yaml is read once per process, not on every search
+    load_config(config_path)
+
+
+def get_search_options():
+    """
+    Country, language and number of results sent with every search. Read on
+    use rather than at import, after config.yaml has set the environment.
+    """
+    load_serper_config()
+    return {
+        "gl": os.environ.get("SERPER_COUNTRY", DEFAULT_SERPER_COUNTRY),
+        "hl": os.environ.get("SERPER_LANGUAGE", DEFAULT_SERPER_LANGUAGE),
+        "num": int(os.environ.get("SERPER_NUM_RESULTS", DEFAULT_SERPER_NUM_RESULTS)),
+    }
+
 
 def format_results(organic_results):
 
@@ -17,40 +57,147 @@ def format_results(organic_results):
             link = result.get('link', '#')
             snippet = result.get('snippet', 'No snippet available.')
             result_strings.append(f"Title: {title}\nLink: {link}\nSnippet: {snippet}\n---")
-        
+
         return '\n'.join(result_strings)
 
+
+def get_search_terms(plan_data, max_terms=MAX_SEARCH_TERMS):
+    """
+    Search terms of a plan, the primary search_term first, without duplicates.
+    """
+    search_terms = [plan_data.get("search_term")] + list(plan_data.get("search_terms") or [])
+    unique_terms = {}
+    for term in search_terms:
+        if isinstance(term, str) and term.strip():
+            unique_terms.setdefault(" ".join(term.lower().split()), " ".join(term.split()))
+    return list(unique_terms.values())[:max_terms]
+
+
+def is_tracking_parameter(key):
+    key = key.lower()
+    return key in TRACKING_PARAMETERS or key.startswith(TRACKING_PARAMETER_PREFIXES)
+
+
+def canonicalize_url(url):
+    """
+    Normalizes a result URL so the same page found by several queries compares
+    equal: http and https, www. and the tracking parameters do not count.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme in ("", "http"):
+        scheme = "https"
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_parameter(key)
+    )
+    return urlunsplit((scheme, host, parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def merge_organic_results(results_per_query):
+    """
+    Interleaves the organic results of several queries by rank and drops
+    pages already listed, so the top result of every query comes first.
+    """
+    merged = {}
+    organic_lists = [results.get("organic") or [] for results in results_per_query]
+    for rank in range(max((len(organic) for organic in organic_lists), default=0)):
+        for organic in organic_lists:
+            if rank < len(organic) and organic[rank].get("link"):
+                merged.setdefault(canonicalize_url(organic[rank]["link"]), organic[rank])
+    return list(merged.values())
+
+
+async def _search(client, search_term, headers, options):
+    response = await asyncio.wait_for(
+        client.post(SERPER_SEARCH_URL, headers=headers, json={"q": search_term, **options}),
+        SERPER_REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()  # Raise an HTTPError for bad responses (4XX, 5XX)
+    return response.json()
+
+
+_revalidating = set()
+
+
+async def _revalidate(client, search_term, headers, options, key):
+    try:
+        search_cache.put(key, await _search(client, search_term, headers, options), search_term)
+    except Exception as e:
+        print(colored(f"Serper: revalidating '{search_term}' failed, keeping the stale result: {e}", 'yellow'))
+    finally:
+        _revalidating.discard(key)
+
+
+async def _cached_search(client, search_term, headers, options):
+    # The options are part of the key, results for another country or language are not reused
+    key = search_cache.make_key(search_term, (options["gl"], options["hl"]), options["num"])
+    response, freshness = search_cache.get(key)
+    if freshness == STALE and key not in _revalidating:
+        # Served now, refreshed in the background on the client loop for the next caller
+        _revalidating.add(key)
+        asyncio.ensure_future(_revalidate(client, search_term, headers, options, key))
+    if freshness in (FRESH, STALE):
+        return response
+    response = await _search(client, search_term, headers, options)
+    search_cache.put(key, response, search_term)
+    return response
+
+
+async def search_serper_async(search_terms, headers, options=None):
+    """
+    Sends all queries at once over the pooled client, cached responses
+    skip the network. Returns the response (or the exception) of every
+    search term, in order.
+    """
+    client = http_client.client
+    options = options if options is not None else get_search_options()
+    return await asyncio.gather(
+        *(_cached_search(client, term, headers, options) for term in search_terms), return_exceptions=True
+    )
+
+
 def get_google_serper(state:AgentGraphState, plan):
-    load_config(config_path)
+    load_serper_config()
 
     plan_data = plan().content
     plan_data = json.loads(plan_data)
-    search = plan_data.get("search_term")
+    search_terms = get_search_terms(plan_data)
+    if not search_terms:
+        return {**state, "serper_response": "No search term provided."}
 
-    search_url = "https://google.serper.dev/search"
-    headers = {
-        'Content-Type': 'application/json',
-        'X-API-KEY': os.environ['SERPER_API_KEY']  # Ensure this environment variable is set with your API key
-    }
-    payload = json.dumps({"q": search})
-    
-    # Attempt to make the HTTP POST request
     try:
-        response = requests.post(search_url, headers=headers, data=payload)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4XX, 5XX)
-        results = response.json()
-        
-        # Check if 'organic' results are in the response
-        if 'organic' in results:
-            formatted_results = format_results(results['organic'])
-            state = {**state, "serper_response": formatted_results}
-            return state
-        else:
-            return {**state, "serper_response": "No organic results found."}
-
-    except requests.exceptions.HTTPError as http_err:
-        return {**state, "serper_response": f"HTTP error occurred: {http_err}"}
-    except requests.exceptions.RequestException as req_err:
-        return {**state, "serper_response": f"Request error occurred: {req_err}"}
+        headers = {
+            'Content-Type': 'application/json',
+            'X-API-KEY': os.environ['SERPER_API_KEY']  # Ensure this environment variable is set with your API key
+        }
     except KeyError as key_err:
-        return {**state, "serper_response": f"Key error occurred: {key_err}"}
\ No newline at end of file
+        return {**state, "serper_response": f"Key error occurred: {key_err}"}
+
+    # Wall-clock time is that of the slowest query
+    started = time.perf_counter()
+    responses = http_client.run(search_serper_async(search_terms, headers, get_search_options()))
+    results = [response for response in responses if not isinstance(response, BaseException)]
+    errors = [response for response in responses if isinstance(response, BaseException)]
+    cache_stats = search_cache.stats()
+    print(colored(
+        f"Serper: {len(search_terms)} queries in {time.perf_counter() - started:.2f}s, {len(errors)} failed "
+        f"(cache: {cache_stats['hits']} hits, {cache_stats['stale_hits']} stale, {cache_stats['misses']} misses)",
+        'cyan',
+    ))
+
+    organic_results = merge_organic_results(results)
+    if organic_results:
+        return {**state, "serper_response": format_results(organic_results)}
+    if not errors:
+        return {**state, "serper_response": "No organic results found."}
+
+    error = errors[0]
+    if isinstance(error, httpx.HTTPStatusError):
+        return {**state, "serper_response": f"HTTP error occurred: {error}"}
+    if isinstance(error, asyncio.TimeoutError):
+        return {**state, "serper_response": f"Request error occurred: timed out after {SERPER_REQUEST_TIMEOUT}s"}
+    return {**state, "serper_response": f"Request error occurred: {error}"}
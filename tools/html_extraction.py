@@ -0,0 +1,221 @@
+import re
+import codecs
+
+from lxml import etree, html as lxml_html
+
+# Characters of text kept per page
+MAX_PAGE_CHARS = 4000
+# Characters of plain text passages are ranked in, for pages without a main content
+MAX_FALLBACK_CHARS = 4 * MAX_PAGE_CHARS
+# Elements whose content is never visible text
+SKIPPED_TAGS = frozenset(("script", "style", "noscript", "template", "svg", "canvas", "iframe", "object"))
+
+# Readability-style boilerplate detection from the class and id of elements
+BOILERPLATE_TAGS = frozenset(("nav", "footer", "aside", "form", "button", "dialog", "menu", "select"))
+UNLIKELY_PATTERN = re.compile(
+    r"banner|breadcrumb|combx|comment|community|consent|cookie|disqus|footer|gdpr|header|menu|modal|navbar|"
+    r"newsletter|pagination|pager|popup|promo|related|share|sidebar|skip|social|sponsor|subscribe|toolbar",
+    re.IGNORECASE,
+)
+POSITIVE_PATTERN = re.compile(r"article|body|content|entry|main|page|post|story|text", re.IGNORECASE)
+NEGATIVE_PATTERN = re.compile(
+    r"comment|contact|footer|footnote|hidden|masthead|media|meta|promo|related|share|sidebar|tags|widget",
+    re.IGNORECASE,
+)
+# Elements whose text is scored, shorter texts do not count
+PARAGRAPH_TAGS = ("p", "pre", "td", "blockquote")
+MIN_PARAGRAPH_CHARS = 25
+# Elements that start a new block of text
+BLOCK_TAGS = frozenset((
+    "p", "pre", "li", "td", "th", "blockquote", "dd", "dt", "figcaption", "caption", "div", "section",
+    "article", "main", "br", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+))
+TAG_SCORES = {"div": 5, "article": 10, "main": 10, "section": 3, "pre": 3, "td": 3, "blockquote": 3,
+              "ol": -3, "ul": -3, "li": -3, "th": -5, "h1": -5, "h2": -5, "h3": -5}
+
+
+def make_html_parser(encoding=None):
+    # Comments are dropped while parsing, so the text around them is kept
+    return lxml_html.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True)
+
+
+def parse_html(data, encoding=None):
+    """
+    Parses raw page bytes with lxml. Returns the root element, None for an empty document.
+    Without a declared encoding, bytes that are valid UTF-8 are read as UTF-8,
+    otherwise lxml uses the <meta> charset of the page.
+    """
+    if encoding is not None:
+        try:
+            encoding = codecs.lookup(encoding).name
+        except LookupError:  # Unknown charset in the response headers
+            encoding = None
+    if encoding is None:
+        try:
+            # Not final, the body may have been cut in the middle of a character
+            codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            pass
+    try:
+        return lxml_html.document_fromstring(data, parser=make_html_parser(encoding))
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def iter_text(root):
+    """
+    Yields the visible text fragments under root in document order, whitespace collapsed.
+    """
+    walker = etree.iterwalk(root, events=("start", "end"))
+    for event, element in walker:
+        if event == "start":
+            if element.tag in SKIPPED_TAGS:
+                walker.skip_subtree()
+                text = None
+            else:
+                text = element.text
+        else:
+            text = element.tail
+        if text:
+            text = " ".join(text.split())
+            if text:
+                yield text
+
+
+def extract_text(data, max_chars=MAX_PAGE_CHARS, encoding=None):
+    """
+    Text of an HTML page, at most max_chars characters. The walk over the
+    document stops as soon as enough text has been collected.
+    """
+    root = parse_html(data, encoding)
+    if root is None:
+        return ""
+    pieces = []
+    length = 0
+    for text in iter_text(root):
+        pieces.append(text)
+        length += len(text) + 1
+        if length >= max_chars:
+            break
+    return " ".join(pieces)[:max_chars]
+
+
+def _class_weight(element):
+    names = f"{element.get('class', '')} {element.get('id', '')}"
+    weight = 0
+    if NEGATIVE_PATTERN.search(names):
+        weight -= 25
+    if POSITIVE_PATTERN.search(names):
+        weight += 25
+    return weight
+
+
+def _text_length(element):
+    # Raw length with inner whitespace, close enough for scoring and much cheaper than normalizing
+    return len(element.text_content().strip())
+
+
+def _link_density(element):
+    length = _text_length(element)
+    if not length:
+        return 1.0
+    return sum(_text_length(link) for link in element.iter("a")) / length
+
+
+def remove_boilerplate(root):
+    """
+    Drops scripts, navigation, footers, forms and the elements whose class
+    or id marks them as banners, menus, cookie notices and the like.
+    """
+    for element in list(root.iter()):
+        if element.getparent() is None or not isinstance(element.tag, str):
+            continue
+        if element.tag in SKIPPED_TAGS or element.tag in BOILERPLATE_TAGS:
+            element.drop_tree()
+            continue
+        names = f"{element.get('class', '')} {element.get('id', '')}"
+        if (element.tag not in ("html", "body", "article", "main")
+                and UNLIKELY_PATTERN.search(names) and not POSITIVE_PATTERN.search(names)):
+            element.drop_tree()
+
+
+def find_main_content(root):
+    """
+    Scores the containers of the paragraphs by their amount of text, commas,
+    class names and link density, as readability does. Returns the best
+    container and its siblings that score close to it, in document order.
+    """
+    scores = {}
+    for paragraph in root.iter(*PARAGRAPH_TAGS):
+        text = paragraph.text_content().strip()
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = paragraph.getparent()
+        grandparent = parent.getparent() if parent is not None else None
+        for ancestor, share in ((parent, 1.0), (grandparent, 0.5)):
+            if ancestor is None:
+                continue
+            if ancestor not in scores:
+                scores[ancestor] = TAG_SCORES.get(ancestor.tag, 0) + _class_weight(ancestor)
+            scores[ancestor] += score * share
+
+    if not scores:
+        body = root.find("body")
+        return [body if body is not None else root]
+    final_scores = {element: score * (1 - _link_density(element)) for element, score in scores.items()}
+    top = max(final_scores, key=final_scores.get)
+    parent = top.getparent()
+    if parent is None:
+        return [top]
+
+    threshold = max(10, final_scores[top] * 0.2)
+    content = []
+    for sibling in parent:
+        if sibling is top or final_scores.get(sibling, float("-inf")) >= threshold:
+            content.append(sibling)
+        elif sibling.tag == "p" and _text_length(sibling) > 80 and _link_density(sibling) < 0.25:
+            content.append(sibling)
+    return content
+
+
+def iter_blocks(element):
+    """
+    Yields the text of every block (paragraph, list item, heading, cell, ...) under element.
+    """
+    walker = etree.iterwalk(element, events=("start", "end"))
+    pieces = []
+    for event, node in walker:
+        if event == "start":
+            if node.tag in BLOCK_TAGS and pieces:
+                yield " ".join(pieces)
+                pieces = []
+            text = node.text
+        else:
+            if node.tag in BLOCK_TAGS and pieces:
+                yield " ".join(pieces)
+                pieces = []
+            text = node.tail if node is not element else None
+        if text:
+            text = " ".join(text.split())
+            if text:
+                pieces.append(text)
+    if pieces:
+        yield " ".join(pieces)
+
+
+def extract_main_blocks(data, encoding=None):
+    """
+    Text blocks of the main content of an HTML page, boilerplate removed.
+    """
+    root = parse_html(data, encoding)
+    if root is None:
+        return []
+    remove_boilerplate(root)
+    blocks = []
+    for element in find_main_content(root):
+        blocks.extend(iter_blocks(element))
+    if not blocks:  # Nothing left after the boilerplate removal, the walk stops once enough text is found
+        blocks = [extract_text(data, MAX_FALLBACK_CHARS, encoding)]
+    return [block for block in blocks if block]
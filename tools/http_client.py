@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import concurrent.futures
+
+import httpx
+
+# Seconds to establish a connection, and for every other phase of a request
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 16
+
+
+class AsyncHTTPClient:
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections=DEFAULT_MAX_KEEPALIVE_CONNECTIONS):
+        """
+        One pooled httpx.AsyncClient living on a background event loop, shared
+        by the web tools so connections are kept alive between graph steps.
+        Synchronous callers submit coroutines with run().
+        """
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_keepalive_connections
+        )
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="http-client", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    @property
+    def client(self):
+        """
+        The pooled client, only to be used from coroutines passed to run().
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, follow_redirects=True)
+        return self._client
+
+    def run(self, coroutine, timeout=None):
+        """
+        Runs coroutine on the client loop and returns its result. Also usable
+        from inside another event loop, the caller's thread just waits.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._start())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        if self._loop is not None and self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._client = None
+
+
+# Shared by the search and scraping tools in this process
+http_client = AsyncHTTPClient()
@@ -0,0 +1,145 @@
+import io
+import base64
+import binascii
+
+from PIL import Image, UnidentifiedImageError
+from termcolor import colored
+
+# Images smaller than this (in pixels per side) are icons, bullets or rules
+MIN_IMAGE_SIDE = 48
+# Grayscale entropy (bits) below which an image is a flat fill or decoration
+MIN_IMAGE_ENTROPY = 2.0
+# Perceptual hashes within this Hamming distance (of 64 bits) are duplicate candidates
+DUPLICATE_HASH_DISTANCE = 2
+# A candidate is only dropped if the mean difference (0-255) of the grayscale thumbnails
+# of both images is below this, and their aspect ratios match within DUPLICATE_ASPECT_RATIO
+DUPLICATE_THUMBNAIL_DIFFERENCE = 3.0
+DUPLICATE_THUMBNAIL_SIZE = 16
+DUPLICATE_ASPECT_RATIO = 0.05
+DEFAULT_MAX_DIMENSION = 1024
+DEFAULT_JPEG_QUALITY = 85
+
+
+def difference_hash(image, hash_size=8):
+    """
+    64-bit perceptual hash comparing the brightness of neighbouring pixels.
+    Robust to re-encoding and rescaling, so it matches repeated logos.
+    """
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(first_hash, second_hash):
+    return bin(first_hash ^ second_hash).count("1")
+
+
+def thumbnail_pixels(image, size=DUPLICATE_THUMBNAIL_SIZE):
+    return image.convert("L").resize((size, size), Image.LANCZOS).tobytes()
+
+
+def thumbnail_difference(first_pixels, second_pixels):
+    """
+    Mean absolute difference of two grayscale thumbnails, 0 for identical images.
+    """
+    return sum(abs(first - second) for first, second in zip(first_pixels, second_pixels)) / len(first_pixels)
+
+
+class ImagePreprocessor:
+    def __init__(self, max_dimension=DEFAULT_MAX_DIMENSION, jpeg_quality=DEFAULT_JPEG_QUALITY,
+                 min_side=MIN_IMAGE_SIDE, min_entropy=MIN_IMAGE_ENTROPY,
+                 duplicate_distance=DUPLICATE_HASH_DISTANCE, duplicate_difference=DUPLICATE_THUMBNAIL_DIFFERENCE):
+        """
+        Prepares the extracted images for the vision model: drops decorative
+        images and near-duplicates, downscales and re-encodes the rest as JPEG.
+        A near-duplicate needs a close perceptual hash and a matching thumbnail.
+        """
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self.min_side = min_side
+        self.min_entropy = min_entropy
+        self.duplicate_distance = duplicate_distance
+        self.duplicate_difference = duplicate_difference
+
+    def is_decorative(self, image):
+        if min(image.size) < self.min_side:
+            return True
+        return image.convert("L").entropy() < self.min_entropy
+
+    def is_duplicate(self, fingerprint, known_fingerprint):
+        image_hash, pixels, aspect_ratio = fingerprint
+        known_hash, known_pixels, known_aspect_ratio = known_fingerprint
+        if hamming_distance(image_hash, known_hash) > self.duplicate_distance:
+            return False
+        # The hash only sees 9x8 pixels, charts of the same layout with other values share it
+        if abs(aspect_ratio - known_aspect_ratio) > DUPLICATE_ASPECT_RATIO * known_aspect_ratio:
+            return False
+        return thumbnail_difference(pixels, known_pixels) <= self.duplicate_difference
+
+    def encode(self, image, image_base64):
+        # Small JPEGs are sent as they are, re-encoding would only cost quality
+        if image.format == "JPEG" and max(image.size) <= self.max_dimension:
+            return image_base64
+        image = image.convert("RGB")
+        if max(image.size) > self.max_dimension:
+            image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    def process(self, images_base64):
+        """
+        Returns the unique prepared images (base64 JPEG) and, for every input
+        image, the index of the unique image it maps to (None if skipped).
+        """
+        unique_images = []
+        unique_fingerprints = []
+        assignments = []
+        skipped = duplicates = 0
+        bytes_in = bytes_out = 0
+
+        for image_base64 in images_base64:
+            try:
+                raw = base64.b64decode(image_base64, validate=True)
+                image = Image.open(io.BytesIO(raw))
+                image.load()
+            except (binascii.Error, ValueError, UnidentifiedImageError, OSError) as e:
+                print(colored(f"Skipping unreadable image: {e}", 'yellow'))
+                assignments.append(None)
+                skipped += 1
+                continue
+
+            if self.is_decorative(image):
+                assignments.append(None)
+                skipped += 1
+                continue
+
+            fingerprint = (difference_hash(image), thumbnail_pixels(image), image.size[0] / image.size[1])
+            duplicate_of = next(
+                (index for index, known_fingerprint in enumerate(unique_fingerprints)
+                 if self.is_duplicate(fingerprint, known_fingerprint)),
+                None,
+            )
+            if duplicate_of is not None:
+                assignments.append(duplicate_of)
+                duplicates += 1
+                continue
+
+            encoded = self.encode(image, image_base64)
+            bytes_in += len(image_base64)
+            bytes_out += len(encoded)
+            assignments.append(len(unique_images))
+            unique_images.append(encoded)
+            unique_fingerprints.append(fingerprint)
+
+        print(colored(
+            f"Images: {len(unique_images)} unique, {duplicates} duplicates, {skipped} skipped, "
+            f"payload {bytes_in // 1024} KB -> {bytes_out // 1024} KB",
+            'cyan',
+        ))
+        return unique_images, assignments
@@ -0,0 +1,105 @@
+from vectorstore.bm25 import BM25Index
+from tools.context_packer import SENTENCE_END_PATTERN, MIN_TRUNCATED_TOKENS, truncate_to_sentences
+from tools.summary_scheduler import count_tokens
+
+# Characters of a passage, blocks are merged up to this size and longer ones split at sentences
+PASSAGE_MAX_CHARS = 800
+# Tokens of page text sent to the reporter per page
+DEFAULT_PAGE_TOKEN_BUDGET = 1000
+BLOCK_SEPARATOR = "\n\n"
+
+
+class Passage:
+    def __init__(self, text, start, end, score=0.0):
+        """
+        Chunk of the main text of a page. start and end are character
+        offsets into that text, kept for citations.
+        """
+        self.text = text
+        self.start = start
+        self.end = end
+        self.score = score
+
+    def __repr__(self):
+        return f"Passage(start={self.start}, end={self.end}, score={self.score:.2f})"
+
+
+def _split_block(block, max_chars):
+    """
+    Splits a block longer than max_chars at sentence ends, returns (offset, text) pairs.
+    """
+    pieces = []
+    start = 0
+    position = 0
+    for match in list(SENTENCE_END_PATTERN.finditer(block)) + [None]:
+        end = match.end() if match else len(block)
+        if end - start > max_chars and position > start:
+            pieces.append((start, block[start:position].rstrip()))
+            start = position
+        position = end
+    pieces.append((start, block[start:].rstrip()))
+    # A single sentence longer than max_chars is cut as it is
+    return [
+        (offset + cut, text[cut:cut + max_chars])
+        for offset, text in pieces for cut in range(0, len(text), max_chars)
+    ]
+
+
+def chunk_passages(blocks, max_chars=PASSAGE_MAX_CHARS):
+    """
+    Groups consecutive text blocks into passages of at most max_chars.
+    Returns the main text (blocks joined by blank lines) and the passages.
+    """
+    text = BLOCK_SEPARATOR.join(blocks)
+    passages = []
+    current_start = current_end = None
+    offset = 0
+    for block in blocks:
+        for piece_offset, piece in _split_block(block, max_chars):
+            start = offset + piece_offset
+            end = start + len(piece)
+            if current_start is not None and end - current_start > max_chars:
+                passages.append(Passage(text[current_start:current_end], current_start, current_end))
+                current_start = None
+            if current_start is None:
+                current_start = start
+            current_end = end
+        offset += len(block) + len(BLOCK_SEPARATOR)
+    if current_start is not None:
+        passages.append(Passage(text[current_start:current_end], current_start, current_end))
+    return text, passages
+
+
+def rank_passages(passages, question):
+    """
+    Scores the passages against question with BM25, best first. Passages
+    with the same score keep their order on the page.
+    """
+    index = BM25Index()
+    index.add(list(range(len(passages))), [passage.text for passage in passages])
+    for position, score in index.search(question or "", k=len(passages)):
+        passages[position].score = score
+    return sorted(passages, key=lambda passage: -passage.score)
+
+
+def select_passages(passages, question, token_budget=DEFAULT_PAGE_TOKEN_BUDGET, model_name="gpt-3.5-turbo"):
+    """
+    The best ranked passages that fit token_budget, back in page order.
+    A passage that does not fit is cut at a sentence end if enough of the
+    budget is left. Without a match for the question this is the beginning of the page.
+    """
+    selected = []
+    remaining = token_budget
+    for passage in rank_passages(passages, question):
+        tokens = count_tokens(passage.text, model_name)
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                continue
+            truncated = truncate_to_sentences(passage.text, remaining, model_name)
+            if not truncated:
+                continue
+            passage = Passage(truncated, passage.start, passage.start + len(truncated), passage.score)
+            tokens = count_tokens(truncated, model_name)
+        selected.append(passage)
+        remaining -= tokens
+    return sorted(selected, key=lambda passage: passage.start)
@@ -0,0 +1,347 @@
+import os
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from termcolor import colored
+from pypdf import PdfReader, PdfWriter
+from unstructured.partition.pdf import partition_pdf
+from unstructured.chunking.title import chunk_by_title
+
+from utils.artifact_cache import artifact_cache
+
+# Default number of pages partitioned by one worker process
+DEFAULT_PAGES_PER_RANGE = 20
+
+# partition_pdf arguments applied after merging the page ranges, not per range
+CHUNKING_PARAMS = ("chunking_strategy", "max_characters", "combine_text_under_n_chars", "new_after_n_chars")
+
+# A page goes through the fast path only if its text layer has at least this many characters
+MIN_TEXT_LAYER_CHARS = 200
+# ... and at most this share of unmapped glyphs or non-printable characters
+MAX_GARBAGE_RATIO = 0.05
+# Used to estimate the time saved when no page went through hi_res
+HI_RES_SECONDS_PER_PAGE = 4.0
+# Per page strategies of "adaptive", a page may be cached under either
+ADAPTIVE_STRATEGIES = ("fast", "hi_res")
+
+
+def get_page_count(file_path):
+    return len(PdfReader(file_path).pages)
+
+
+def split_page_ranges(page_count, pages_per_range=DEFAULT_PAGES_PER_RANGE):
+    """
+    Splits the pages into (start, end) ranges, 0-based and end exclusive.
+    """
+    return [
+        (start, min(start + pages_per_range, page_count))
+        for start in range(0, page_count, pages_per_range)
+    ]
+
+
+def write_page_range(file_path, start, end):
+    """
+    Writes pages [start, end) of the PDF into a temporary file and returns its path.
+    """
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for page_number in range(start, end):
+        writer.add_page(reader.pages[page_number])
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
+        writer.write(tmp_file)
+    return tmp_file.name
+
+
+def partition_page_range(file_path, start, end, element_params):
+    """
+    Partitions pages [start, end) of the PDF into unchunked elements.
+    Runs in a worker process, page numbers and filename refer to the original document.
+    """
+    started = time.perf_counter()
+    range_path = write_page_range(file_path, start, end)
+    try:
+        elements = partition_pdf(
+            filename=range_path,
+            metadata_filename=file_path,
+            starting_page_number=start + 1,
+            **element_params,
+        )
+    finally:
+        os.remove(range_path)
+    return start, elements, time.perf_counter() - started
+
+
+def partition_page_ranges(file_path, page_ranges, element_params, max_workers=None):
+    """
+    Partitions (start, end, strategy) page ranges, in a process pool unless max_workers is 1.
+    Returns the elements in page order and the partition time of every range.
+    """
+    tasks = [
+        (file_path, start, end, {**element_params, "strategy": strategy})
+        for start, end, strategy in page_ranges
+    ]
+    if max_workers == 1:
+        results = [partition_page_range(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(partition_page_range, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+    results.sort(key=lambda result: result[0])
+    elements = [element for _, range_elements, _ in results for element in range_elements]
+    timings = {start: elapsed for start, _, elapsed in results}
+    return elements, timings
+
+
+def chunk_elements(elements, chunking_params):
+    chunking_params = dict(chunking_params)
+    chunking_strategy = chunking_params.pop("chunking_strategy", None)
+    if chunking_strategy is None:
+        return elements
+    if chunking_strategy != "by_title":
+        raise ValueError(f"Unsupported chunking strategy for page range partitioning: {chunking_strategy}")
+    return chunk_by_title(elements, **chunking_params)
+
+
+def split_partition_params(partition_params):
+    element_params = {key: value for key, value in partition_params.items() if key not in CHUNKING_PARAMS}
+    chunking_params = {key: value for key, value in partition_params.items() if key in CHUNKING_PARAMS}
+    return element_params, chunking_params
+
+
+def get_page_keys(page_hashes, element_params, strategies):
+    """
+    Keys of the elements of every page in the "page" stage of the artifact cache.
+    """
+    return [
+        artifact_cache.make_key(page_hash, element_params, page_strategy)
+        for page_hash, page_strategy in zip(page_hashes, strategies)
+    ]
+
+
+def put_page_elements(elements, page_hashes, element_params, strategies):
+    """
+    Caches the elements of a fully partitioned document page by page, so a
+    later revision of it only partitions its changed pages.
+    """
+    pages = [[] for _ in page_hashes]
+    for element in elements:
+        pages[element.metadata.page_number - 1].append(element)
+    artifact_cache.put_many("page", zip(get_page_keys(page_hashes, element_params, strategies), pages))
+
+
+def has_cached_pages(page_hashes, partition_params):
+    """
+    Checks if any page was partitioned before with these parameters, in this
+    document or an earlier revision of it.
+    """
+    element_params, _ = split_partition_params(partition_params)
+    strategy = element_params.pop("strategy", "hi_res")
+    strategies = ADAPTIVE_STRATEGIES if strategy == "adaptive" else (strategy,)
+    return any(
+        artifact_cache.contains("page", key)
+        for page_strategy in strategies
+        for key in get_page_keys(page_hashes, element_params, [page_strategy] * len(page_hashes))
+    )
+
+
+def estimate_time_saved(page_ranges, timings):
+    """
+    Pages and partition time of each adaptive strategy, and the time the fast
+    pages saved against hi_res, per page measured on this document where possible.
+    """
+    elapsed = {"fast": 0.0, "hi_res": 0.0}
+    pages = {"fast": 0, "hi_res": 0}
+    for start, end, strategy in page_ranges:
+        elapsed[strategy] += timings[start]
+        pages[strategy] += end - start
+    hi_res_per_page = elapsed["hi_res"] / pages["hi_res"] if pages["hi_res"] else HI_RES_SECONDS_PER_PAGE
+    return {
+        "fast_pages": pages["fast"],
+        "hi_res_pages": pages["hi_res"],
+        "partition_seconds": elapsed["fast"] + elapsed["hi_res"],
+        "estimated_seconds_saved": max(pages["fast"] * hi_res_per_page - elapsed["fast"], 0.0),
+    }
+
+
+def partition_pdf_parallel(file_path, partition_params, max_workers=None, pages_per_range=DEFAULT_PAGES_PER_RANGE,
+                           page_hashes=None):
+    """
+    Partitions the PDF page range by page range in a process pool, merges the
+    elements back in page order and chunks them once over the whole document,
+    so sections spanning a range boundary end up in the same chunk.
+    With page_hashes the elements of every page are cached for incremental partitioning.
+    """
+    element_params, chunking_params = split_partition_params(partition_params)
+    strategy = element_params.pop("strategy", "hi_res")
+
+    page_ranges = split_page_ranges(get_page_count(file_path), pages_per_range)
+    if page_hashes is not None and (len(page_ranges) <= 1 or max_workers == 1):
+        elements = partition_pdf(filename=file_path, strategy=strategy, **element_params)
+        put_page_elements(elements, page_hashes, element_params, [strategy] * len(page_hashes))
+        return chunk_elements(elements, chunking_params)
+    if len(page_ranges) <= 1 or max_workers == 1:
+        return partition_pdf(filename=file_path, **partition_params)
+
+    print(colored(f"Partitioning {len(page_ranges)} page ranges in parallel", 'cyan'))
+    elements, _ = partition_page_ranges(
+        file_path,
+        [(start, end, strategy) for start, end in page_ranges],
+        element_params,
+        max_workers=max_workers,
+    )
+    if page_hashes is not None:
+        put_page_elements(elements, page_hashes, element_params, [strategy] * len(page_hashes))
+    return chunk_elements(elements, chunking_params)
+
+
+def is_clean_text_layer(text):
+    """
+    Checks if a page text layer is usable as is (born-digital page, no OCR needed).
+    """
+    text = (text or "").strip()
+    if len(text) < MIN_TEXT_LAYER_CHARS:
+        return False
+    garbage = text.count("(cid:") + sum(1 for char in text if char == "\ufffd" or not (char.isprintable() or char.isspace()))
+    return garbage <= len(text) * MAX_GARBAGE_RATIO
+
+
+def probe_page_strategies(file_path):
+    """
+    Decides the partition strategy of every page from its text layer.
+    Pages with clean text go through "fast", scanned pages and pages with
+    tables or images need "hi_res" layout detection and OCR.
+    """
+    strategies = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            needs_layout = (
+                not is_clean_text_layer(page.extract_text())
+                or len(page.images) > 0
+                or len(page.find_tables()) > 0
+            )
+            strategies.append("hi_res" if needs_layout else "fast")
+            page.flush_cache()
+    return strategies
+
+
+def group_page_strategies(strategies, pages_per_range=DEFAULT_PAGES_PER_RANGE):
+    """
+    Groups consecutive pages with the same strategy into (start, end, strategy)
+    ranges of at most pages_per_range pages.
+    """
+    page_ranges = []
+    start = 0
+    for page_number in range(1, len(strategies) + 1):
+        if (
+            page_number == len(strategies)
+            or strategies[page_number] != strategies[start]
+            or page_number - start >= pages_per_range
+        ):
+            page_ranges.append((start, page_number, strategies[start]))
+            start = page_number
+    return page_ranges
+
+
+def partition_pdf_adaptive(file_path, partition_params, max_workers=1, pages_per_range=DEFAULT_PAGES_PER_RANGE,
+                           page_hashes=None):
+    """
+    Partitions every page with the cheapest strategy its content allows and
+    chunks the merged elements once. Returns the chunks and a report with the
+    strategy used for each page and the estimated time saved against hi_res.
+    With page_hashes the elements of every page are cached for incremental partitioning.
+    """
+    element_params, chunking_params = split_partition_params(partition_params)
+    element_params.pop("strategy", None)
+
+    strategies = probe_page_strategies(file_path)
+    page_ranges = group_page_strategies(strategies, pages_per_range)
+    elements, timings = partition_page_ranges(file_path, page_ranges, element_params, max_workers=max_workers)
+    if page_hashes is not None:
+        put_page_elements(elements, page_hashes, element_params, strategies)
+
+    report = {
+        "page_strategies": {page_number + 1: strategy for page_number, strategy in enumerate(strategies)},
+        **estimate_time_saved(page_ranges, timings),
+    }
+    print(colored(
+        f"Adaptive partitioning: {report['fast_pages']} fast pages, {report['hi_res_pages']} hi_res pages, "
+        f"~{report['estimated_seconds_saved']:.1f}s saved",
+        'cyan',
+    ))
+    return chunk_elements(elements, chunking_params), report
+
+
+def get_page_hashes(file_path):
+    """
+    Content hash of every page: its content stream and the data of the images it draws.
+    """
+    page_hashes = []
+    for page in PdfReader(file_path).pages:
+        digest = hashlib.sha256(str(list(page.mediabox)).encode("utf-8"))
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources is not None else None
+        if xobjects is not None:
+            xobjects = xobjects.get_object()
+            for name in sorted(xobjects):
+                digest.update(name.encode("utf-8"))
+                digest.update(xobjects[name].get_object().get_data())
+        page_hashes.append(digest.hexdigest())
+    return page_hashes
+
+
+def partition_pdf_incremental(file_path, partition_params, page_hashes=None, max_workers=1,
+                              pages_per_range=DEFAULT_PAGES_PER_RANGE):
+    """
+    Partitions only the pages whose content was not partitioned before, in any
+    document, and reuses the cached elements of all other pages. A revised
+    document thus only costs its changed pages. The merged elements are chunked once.
+    strategy "adaptive" picks fast or hi_res per page like partition_pdf_adaptive.
+    """
+    element_params, chunking_params = split_partition_params(partition_params)
+    strategy = element_params.pop("strategy", "hi_res")
+    page_hashes = page_hashes or get_page_hashes(file_path)
+    strategies = probe_page_strategies(file_path) if strategy == "adaptive" else [strategy] * len(page_hashes)
+
+    keys = get_page_keys(page_hashes, element_params, strategies)
+    cached = artifact_cache.get_many("page", keys)
+    missing = [page_number for page_number, elements in enumerate(cached) if elements is None]
+
+    # Only contiguous runs of missing pages are partitioned
+    marked = [strategies[page_number] if cached[page_number] is None else None for page_number in range(len(keys))]
+    page_ranges = [page_range for page_range in group_page_strategies(marked, pages_per_range) if page_range[2] is not None]
+    elements, timings = partition_page_ranges(file_path, page_ranges, element_params, max_workers=max_workers)
+    new_pages = {page_number: [] for page_number in missing}
+    for element in elements:
+        new_pages[element.metadata.page_number - 1].append(element)
+    artifact_cache.put_many("page", [(keys[page_number], new_pages[page_number]) for page_number in missing])
+
+    merged = []
+    for page_number, page_elements in enumerate(cached):
+        if page_elements is None:
+            page_elements = new_pages[page_number]
+        for element in page_elements:
+            # Cached pages may come from another position in an earlier revision
+            element.metadata.page_number = page_number + 1
+        merged.extend(page_elements)
+
+    report = {
+        "page_hashes": page_hashes,
+        "page_strategies": {page_number + 1: page_strategy for page_number, page_strategy in enumerate(strategies)},
+        "partitioned_pages": [page_number + 1 for page_number in missing],
+        "reused_pages": len(keys) - len(missing),
+    }
+    if strategy == "adaptive":
+        report.update(estimate_time_saved(page_ranges, timings))
+    print(colored(
+        f"Incremental partitioning: {len(missing)} pages partitioned, {report['reused_pages']} pages reused",
+        'cyan',
+    ))
+    return chunk_elements(merged, chunking_params), report
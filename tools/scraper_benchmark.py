@@ -0,0 +1,115 @@
+"""
+Compares the text extraction of the scraper with the former BeautifulSoup path.
+
+    python -m tools.scraper_benchmark --pages data/pages --repeat 5 --question "quarterly revenue"
+
+Every saved page (*.html, *.htm) is extracted with BeautifulSoup
+(html.parser, all stripped strings joined, then cut to 4000 characters)
+and with the path the scraper ships: the main content of the page,
+boilerplate removed, cut into passages of which the best ranked for the
+question fit the page token budget. The lxml plain text extraction, which
+the scraper falls back to for pages without a main content, is timed as well. Reports the p50/p99 time per page and how many of the
+baseline words the scraper returns. Without saved pages, synthetic pages
+with navigation, scripts and a long article are generated.
+"""
+import os
+import glob
+import time
+import random
+import argparse
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+from tools.html_extraction import extract_text, MAX_PAGE_CHARS
+from tools.basic_scraper import extract_page_text
+
+DEFAULT_PAGES_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "pages")
+
+
+def extract_text_soup(data, max_chars=MAX_PAGE_CHARS):
+    """
+    The extraction used before the lxml fast path.
+    """
+    soup = BeautifulSoup(data, 'html.parser')
+    return ' '.join(soup.stripped_strings)[:max_chars]
+
+
+def make_synthetic_page(paragraphs, seed=0):
+    rng = random.Random(seed)
+    words = ["revenue", "growth", "market", "quarter", "analysis", "report", "customer", "product", "data", "result"]
+    sentence = lambda: " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+    navigation = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(60))
+    script = "<script>" + "var tracking = {id: 1, events: []};" * 200 + "</script>"
+    article = "".join(f"<p>{' '.join(sentence() for _ in range(5))}</p>" for _ in range(paragraphs))
+    return (
+        f"<html><head><title>Synthetic page {seed}</title>{script}<style>body {{margin: 0}}</style></head>"
+        f"<body><nav><ul>{navigation}</ul></nav><article><h1>Report {seed}</h1>{article}</article>"
+        f"<footer>Cookies and privacy</footer>{script}</body></html>"
+    ).encode("utf-8")
+
+
+def load_pages(pages_dir, synthetic):
+    paths = sorted(glob.glob(os.path.join(pages_dir, "*.htm*")))
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "rb") as file:
+                pages.append(file.read())
+        return pages
+    print(f"No saved pages in {pages_dir}, generating {synthetic} synthetic pages")
+    return [make_synthetic_page(paragraphs=50 * (1 + i % 20), seed=i) for i in range(synthetic)]
+
+
+def time_extraction(extract, pages, repeat):
+    timings = []
+    outputs = []
+    for page in pages:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            text = extract(page)
+        timings.append((time.perf_counter() - started) / repeat)
+        outputs.append(text)
+    return np.array(timings) * 1000, outputs
+
+
+def word_recall(baseline, candidate):
+    baseline_words = baseline.split()
+    if not baseline_words:
+        return 1.0
+    candidate_words = set(candidate.split())
+    return sum(word in candidate_words for word in baseline_words) / len(baseline_words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default=DEFAULT_PAGES_DIR, help="directory of saved .html pages")
+    parser.add_argument("--synthetic", type=int, default=40, help="synthetic pages if the directory has none")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-chars", type=int, default=MAX_PAGE_CHARS)
+    parser.add_argument("--question", default=None, help="question the passages are ranked for")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.synthetic)
+    total_bytes = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {total_bytes / len(pages) / 1024:.0f} KiB on average")
+
+    soup_ms, soup_texts = time_extraction(lambda page: extract_text_soup(page, args.max_chars), pages, args.repeat)
+    lxml_ms, lxml_texts = time_extraction(lambda page: extract_text(page, args.max_chars), pages, args.repeat)
+    scraper_ms, scraper_texts = time_extraction(
+        lambda page: extract_page_text(page, question=args.question)[0], pages, args.repeat
+    )
+    lxml_recall = np.mean([word_recall(soup, text) for soup, text in zip(soup_texts, lxml_texts)])
+    scraper_recall = np.mean([word_recall(soup, text) for soup, text in zip(soup_texts, scraper_texts)])
+
+    print(f"{'extractor':<14}{'p50 ms':>10}{'p99 ms':>10}{'total s':>10}{'recall':>10}")
+    for name, timings, recall in (("beautifulsoup", soup_ms, 1.0), ("lxml text", lxml_ms, lxml_recall),
+                                  ("scraper", scraper_ms, scraper_recall)):
+        print(f"{name:<14}{np.percentile(timings, 50):>10.2f}{np.percentile(timings, 99):>10.2f}"
+              f"{timings.sum() / 1000:>10.2f}{recall:>10.1%}")
+    print(f"the scraper takes {scraper_ms.sum() / soup_ms.sum():.2f}x the BeautifulSoup time and returns {scraper_recall:.1%} "
+          f"of the BeautifulSoup words (navigation and scripts are meant to be missing)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Root directory of the cached search engine responses
+SEARCH_CACHE_DIR = os.environ.get(
+    "SEARCH_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "search_cache")
+)
+# Responses younger than this are served without a request (seconds), unless
+# SEARCH_CACHE_TTL is set in the environment or config.yaml
+DEFAULT_SEARCH_CACHE_TTL = 24 * 60 * 60
+# Expired responses are still served for this long while a fresh one is fetched
+# in the background, unless SEARCH_CACHE_STALE_TTL is set
+DEFAULT_STALE_TTL = 7 * 24 * 60 * 60
+# Least recently used responses are evicted above this size on disk (64 MiB)
+DEFAULT_SEARCH_CACHE_BYTES = 64 * 1024 * 1024
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    def __init__(self, root=SEARCH_CACHE_DIR, ttl=None, stale_ttl=None, max_bytes=DEFAULT_SEARCH_CACHE_BYTES):
+        """
+        On-disk cache of search responses, one JSON file per normalized query,
+        locale and result count. Fresh entries are served as they are, stale
+        entries are served while the caller revalidates them. The least
+        recently used entries are evicted to stay under max_bytes.
+        Without ttl and stale_ttl they are read from the environment on first
+        use, after the search tool has loaded config.yaml.
+        """
+        self.root = root
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # key -> [size, last used], scanned from disk on first use
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            self._ttl = int(os.environ.get("SEARCH_CACHE_TTL", DEFAULT_SEARCH_CACHE_TTL))
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, ttl):
+        self._ttl = ttl
+
+    @property
+    def stale_ttl(self):
+        if self._stale_ttl is None:
+            self._stale_ttl = int(os.environ.get("SEARCH_CACHE_STALE_TTL", DEFAULT_STALE_TTL))
+        return self._stale_ttl
+
+    @stale_ttl.setter
+    def stale_ttl(self, stale_ttl):
+        self._stale_ttl = stale_ttl
+
+    @staticmethod
+    def make_key(query, locale=None, num_results=None):
+        serialized = json.dumps([normalize_query(query), locale, num_results], sort_keys=True)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _load_entries(self):
+        if self._entries is None:
+            self._entries = {}
+            for directory, _, file_names in os.walk(self.root):
+                for file_name in file_names:
+                    if file_name.endswith(".json"):
+                        stat = os.stat(os.path.join(directory, file_name))
+                        self._entries[file_name[:-5]] = [stat.st_size, stat.st_mtime]
+        return self._entries
+
+    def get(self, key):
+        """
+        Returns (response, FRESH or STALE), or (None, None) if the key is missing or expired.
+        """
+        now = time.time()
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            entry = None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self._remove(key)
+            entry = None
+
+        with self._lock:
+            age = now - entry["created"] if entry is not None else None
+            if age is None or age >= self.ttl + self.stale_ttl:
+                self.misses += 1
+                return None, None
+            self._load_entries().setdefault(key, [0, now])[1] = now
+            if age < self.ttl:
+                self.hits += 1
+                return entry["response"], FRESH
+            self.stale_hits += 1
+            return entry["response"], STALE
+
+    def put(self, key, response, query=None):
+        data = json.dumps({"created": time.time(), "query": query, "response": response}).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically, so a concurrent reader never sees a half written entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._load_entries()[key] = [len(data), time.time()]
+            self._evict()
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        entries = self._load_entries()
+        total = sum(size for size, _ in entries.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            del entries[key]
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# Shared by all searches in this process
+search_cache = SearchCache()
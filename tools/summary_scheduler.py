@@ -0,0 +1,247 @@
+import time
+import random
+import asyncio
+import threading
+from functools import lru_cache
+
+import openai
+import tiktoken
+from termcolor import colored
+from langchain_core.output_parsers import StrOutputParser
+
+# Defaults match a low usage tier of the OpenAI API
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MAX_RETRIES = 6
+
+# Tokens reserved for the completion of one summary
+SUMMARY_OUTPUT_TOKENS = 300
+# Tokens of one image sent with "auto" detail (4 tiles of 512px + base)
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model_name="gpt-3.5-turbo"):
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def pack_by_token_budget(sizes, budget):
+    """
+    Groups consecutive item indices so that the summed size of a group stays within budget.
+    An item larger than the budget forms its own group.
+    """
+    packs = []
+    current = []
+    current_size = 0
+    for index, size in enumerate(sizes):
+        if current and current_size + size > budget:
+            packs.append(current)
+            current = []
+            current_size = 0
+        current.append(index)
+        current_size += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        """
+        Continuously refilled budget of per_minute units (requests or tokens).
+        """
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.capacity)
+
+    def limit_remaining(self, remaining):
+        """
+        Aligns the local budget with the remaining budget reported by the API.
+        """
+        self._refill()
+        self.available = min(self.available, float(remaining))
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_concurrency, min_concurrency=1):
+        """
+        Concurrency limit with additive increase on success and
+        multiplicative decrease on rate limiting.
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = max(min_concurrency, max_concurrency // 2)
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def on_success(self):
+        async with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    async def on_rate_limited(self):
+        async with self._condition:
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            self._successes = 0
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return getattr(error, "status_code", None) in (429, 500, 502, 503, 504)
+
+
+def get_error_headers(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def get_response_headers(message):
+    # Only set by LLMs created with include_response_headers=True
+    return (getattr(message, "response_metadata", None) or {}).get("headers") or {}
+
+
+class SummaryScheduler:
+    def __init__(self, model_name="gpt-3.5-turbo",
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        """
+        Runs the summary requests of all modalities under one requests/min and
+        tokens/min budget, adapting the concurrency to rate limit responses.
+        """
+        self.model_name = model_name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_limited = 0
+        self.retries = 0
+
+    def estimate_tokens(self, text, images=0):
+        return count_tokens(text, self.model_name) + images * IMAGE_TOKEN_ESTIMATE + SUMMARY_OUTPUT_TOKENS
+
+    def _apply_headers(self, headers):
+        if "x-ratelimit-remaining-requests" in headers:
+            self._request_bucket.limit_remaining(headers["x-ratelimit-remaining-requests"])
+        if "x-ratelimit-remaining-tokens" in headers:
+            self._token_bucket.limit_remaining(headers["x-ratelimit-remaining-tokens"])
+
+    async def _run_job(self, index, job, on_result):
+        chain, chain_input, estimated_tokens = job
+        for attempt in range(self.max_retries + 1):
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated_tokens)
+            try:
+                async with self._limiter:
+                    message = await chain.ainvoke(chain_input)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                headers = get_error_headers(e)
+                self._apply_headers(headers)
+                if isinstance(e, openai.RateLimitError) or getattr(e, "status_code", None) == 429:
+                    self.rate_limited += 1
+                    await self._limiter.on_rate_limited()
+                self.retries += 1
+                # Honour retry-after, otherwise exponential backoff with full jitter
+                retry_after = headers.get("retry-after")
+                delay = float(retry_after) if retry_after else random.uniform(0, min(60, 2 ** attempt))
+                await asyncio.sleep(delay)
+                continue
+
+            self._apply_headers(get_response_headers(message))
+            await self._limiter.on_success()
+            summary = StrOutputParser().invoke(message)
+            if on_result is not None:
+                # Callbacks may store and embed the summary, which blocks, so they run in a worker thread
+                await asyncio.to_thread(on_result, index, summary)
+            return summary
+
+    async def arun(self, jobs, on_result=None):
+        """
+        Runs (chain, chain_input, estimated_tokens) jobs, the chains must end with the LLM.
+        The x-ratelimit-remaining-* headers of successful and rate limited responses
+        align the budgets with the quota left.
+        on_result(index, summary) is called in a worker thread as soon as each summary is ready.
+        Returns the summaries in job order.
+        """
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+        self._limiter = AdaptiveLimiter(self.max_concurrency)
+        started = time.perf_counter()
+        summaries = await asyncio.gather(
+            *(self._run_job(index, job, on_result) for index, job in enumerate(jobs))
+        )
+        print(colored(
+            f"Summarized {len(jobs)} chunks in {time.perf_counter() - started:.1f}s "
+            f"({self.rate_limited} rate limited, {self.retries} retries)",
+            'cyan',
+        ))
+        return summaries
+
+    def run(self, jobs, on_result=None):
+        """
+        Synchronous entry point for arun, also usable from inside a running event loop.
+        """
+        if not jobs:
+            return []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.arun(jobs, on_result))
+
+        # Already inside an event loop (e.g. an async UI), run in a helper thread
+        result = {}
+
+        def target():
+            try:
+                result["summaries"] = asyncio.run(self.arun(jobs, on_result))
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        return result["summaries"]
@@ -0,0 +1,327 @@
+import os
+import io
+import re
+import csv
+import hashlib
+from types import SimpleNamespace
+from html.parser import HTMLParser
+
+from termcolor import colored
+
+from tools.summary_scheduler import count_tokens
+from vectorstore.blobstore import ReferenceCounts, REFERENCES_FILE, remove_file
+
+# Root directory of the columnar side files of the ingested tables
+TABLE_STORE_DIR = os.environ.get(
+    "TABLE_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "tables")
+)
+TABLE_TEXT_FORMATS = ("markdown", "csv")
+DEFAULT_TABLE_TEXT_FORMAT = "markdown"
+# A column is numeric if at least this share of its non-empty cells parse as numbers
+NUMERIC_COLUMN_RATIO = 0.8
+
+# "$1,200.50", "-3.4%", "(450)", "€ 12 000", "−7"
+NUMBER_PATTERN = re.compile(r"^(\()?[-+\u2212]?[$€£¥]?\s*[-+\u2212]?(\d{1,3}(?:[, \u00a0\u202f]\d{3})+|\d+)?(\.\d+)?\s*%?(\))?$")
+
+
+def _span(attrs, name):
+    try:
+        return max(1, int(attrs.get(name) or 1))
+    except ValueError:
+        return 1
+
+
+class _TableParser(HTMLParser):
+    """Collects the cell texts of every row of an HTML table, expanding colspans and rowspans."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.header_flags = []
+        self._row = None
+        self._cell = None
+        self._colspan = 1
+        self._rowspan = 1
+        self._is_header = False
+        # Column -> [rows left, text] of the cells spanning down from the rows above
+        self._pending = {}
+
+    def _fill_pending(self, trailing=False):
+        """
+        Copies the cells spanning down from the rows above at the end of the
+        current row. With trailing, also those further right, gaps left empty.
+        """
+        while self._pending:
+            column = len(self._row)
+            if column in self._pending:
+                span = self._pending[column]
+                self._row.append(span[1])
+                span[0] -= 1
+                if span[0] == 0:
+                    del self._pending[column]
+            elif trailing and max(self._pending) > column:
+                self._row.append("")
+            else:
+                break
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+            self._is_header = False
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+            attrs = dict(attrs)
+            self._colspan = _span(attrs, "colspan")
+            self._rowspan = _span(attrs, "rowspan")
+            self._is_header = self._is_header or tag == "th"
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            text = " ".join("".join(self._cell).split())
+            self._fill_pending()
+            for _ in range(self._colspan):
+                if self._rowspan > 1:
+                    self._pending[len(self._row)] = [self._rowspan - 1, text]
+                self._row.append(text)
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self._fill_pending(trailing=True)
+            if any(self._row):
+                self.rows.append(self._row)
+                self.header_flags.append(self._is_header)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def parse_html_table(html):
+    """
+    Returns the rows of an HTML table as lists of cell texts, all padded to
+    the same width, and the number of leading header rows (<th> cells).
+    """
+    parser = _TableParser()
+    parser.feed(html)
+    parser.close()
+    width = max((len(row) for row in parser.rows), default=0)
+    rows = [row + [""] * (width - len(row)) for row in parser.rows]
+    header_rows = 0
+    while header_rows < len(rows) and parser.header_flags[header_rows]:
+        header_rows += 1
+    return rows, header_rows
+
+
+def parse_number(text):
+    """
+    Returns the value of a numeric cell, None if it is not one. Thousands
+    separators, currency signs, percent signs and negative values in
+    parentheses are accepted.
+    """
+    text = text.strip()
+    match = NUMBER_PATTERN.match(text)
+    if not text or not match or not (match.group(2) or match.group(3)) or bool(match.group(1)) != bool(match.group(4)):
+        return None
+    value = float((match.group(2) or "0").replace(",", "").replace(" ", "").replace("\u00a0", "").replace("\u202f", "")
+                  + (match.group(3) or ""))
+    negative = match.group(1) or "-" in text or "\u2212" in text
+    return -value if negative else value
+
+
+def _escape_markdown_cell(text):
+    return text.replace("|", "\\|")
+
+
+class CompactTable:
+    def __init__(self, rows, header_rows=1, metadata=None, text_format=DEFAULT_TABLE_TEXT_FORMAT,
+                 data_path=None, source_tokens=None):
+        """
+        Table normalized at ingestion: its cells as rows of strings, rendered
+        as Markdown or CSV for summaries and prompts instead of the HTML.
+        data_path points to the Parquet side file of the cells, if written.
+        """
+        if text_format not in TABLE_TEXT_FORMATS:
+            raise ValueError(f"Unknown table format: {text_format}. Choose one of {TABLE_TEXT_FORMATS}.")
+        self.rows = rows
+        self.header_rows = header_rows
+        self.metadata = metadata if metadata is not None else SimpleNamespace(page_number=None)
+        self.text_format = text_format
+        self.data_path = data_path
+        self.source_tokens = source_tokens
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"CompactTable(rows={len(self.rows)}, columns={self.column_count}, page_number={self.metadata.page_number})"
+
+    @property
+    def column_count(self):
+        return len(self.rows[0]) if self.rows else 0
+
+    @property
+    def header(self):
+        """
+        Column names, the header rows joined per column. The first row if the table marks none.
+        """
+        header_rows = self.rows[:self.header_rows or 1]
+        return [" ".join(dict.fromkeys(cell for cell in column if cell)) for column in zip(*header_rows)]
+
+    @property
+    def body(self):
+        return self.rows[self.header_rows or 1:]
+
+    @property
+    def column_names(self):
+        """
+        The header made unique and non-empty, usable as dataframe column names.
+        """
+        names = [name or f"column_{i}" for i, name in enumerate(self.header)]
+        return [name if names.index(name) == i else f"{name}_{i}" for i, name in enumerate(names)]
+
+    @property
+    def column_types(self):
+        """
+        "number" or "text" per column, inferred from the body cells.
+        """
+        types = []
+        for column in zip(*self.body) if self.body else [()] * self.column_count:
+            cells = [cell for cell in column if cell.strip()]
+            numbers = sum(parse_number(cell) is not None for cell in cells)
+            types.append("number" if cells and numbers >= NUMERIC_COLUMN_RATIO * len(cells) else "text")
+        return types
+
+    def typed_columns(self):
+        """
+        Body values per column name, numeric columns parsed to floats (None if empty or unparsable).
+        """
+        columns = {}
+        body_columns = list(zip(*self.body)) if self.body else [()] * self.column_count
+        for name, column_type, column in zip(self.column_names, self.column_types, body_columns):
+            columns[name] = [parse_number(cell) for cell in column] if column_type == "number" else list(column)
+        return columns
+
+    def to_dataframe(self):
+        """
+        pandas DataFrame of the body with the inferred column names and types,
+        read from the Parquet side file if one was written.
+        """
+        import pandas as pd
+
+        if self.data_path is not None and self.data_path.endswith(".parquet"):
+            try:
+                return pd.read_parquet(self.data_path)
+            except (OSError, ImportError):  # Side file deleted or pyarrow gone, the cells are still here
+                pass
+        columns = self.typed_columns()
+        types = dict(zip(self.column_names, self.column_types))
+        return pd.DataFrame({
+            name: pd.Series(values, dtype="float64" if types[name] == "number" else "object")
+            for name, values in columns.items()
+        })
+
+    @property
+    def text(self):
+        if not self.rows:
+            return ""
+        if len(self.rows) == 1 and self.column_count == 1:
+            return self.rows[0][0]  # Plain text of a table without structure
+        if self.text_format == "csv":
+            return self.to_csv()
+        return self.to_markdown()
+
+    def to_markdown(self):
+        lines = ["| " + " | ".join(_escape_markdown_cell(cell) for cell in self.header) + " |"]
+        lines.append("|" + "---|" * self.column_count)
+        for row in self.body:
+            lines.append("| " + " | ".join(_escape_markdown_cell(cell) for cell in row) + " |")
+        return "\n".join(lines)
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(self.header)
+        writer.writerows(self.body)
+        return buffer.getvalue().rstrip("\n")
+
+
+# Docstore entries referring to every side file
+table_references = ReferenceCounts(os.path.join(TABLE_STORE_DIR, REFERENCES_FILE))
+
+
+def acquire_table_file(path):
+    table_references.acquire(os.path.basename(path))
+
+
+def release_table_file(path):
+    """
+    Drops one reference to a side file, the file is deleted with the last one.
+    """
+    return table_references.release(os.path.basename(path), on_last=lambda: remove_file(path))
+
+
+def write_table_file(table, root=TABLE_STORE_DIR):
+    """
+    Writes the cells of table to a content-addressed Parquet file with the
+    inferred column types. Returns the path, None if pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    content_hash = hashlib.sha256(table.to_csv().encode("utf-8")).hexdigest()
+    path = os.path.join(root, content_hash[:2], content_hash + ".parquet")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(pa.table(table.typed_columns()), tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def compact_table(element, text_format=DEFAULT_TABLE_TEXT_FORMAT, write_file=True):
+    """
+    Converts an unstructured Table or TableChunk into a CompactTable. Tables
+    without an HTML structure keep their plain text as a single cell.
+    """
+    metadata = getattr(element, "metadata", None)
+    html = getattr(metadata, "text_as_html", None)
+    rows, header_rows = parse_html_table(html) if html else ([], 0)
+    if not rows:
+        rows, header_rows = [[getattr(element, "text", "") or ""]], 0
+    table = CompactTable(
+        rows,
+        header_rows,
+        SimpleNamespace(
+            page_number=getattr(metadata, "page_number", None),
+            filename=getattr(metadata, "filename", None),
+        ),
+        text_format,
+        source_tokens=count_tokens(html) if html else None,
+    )
+    if write_file and html:
+        table.data_path = write_table_file(table)
+    return table
+
+
+def compact_tables(elements, text_format=DEFAULT_TABLE_TEXT_FORMAT, write_file=True):
+    """
+    Converts the extracted tables and logs the prompt tokens saved compared to their HTML.
+    """
+    tables = [compact_table(element, text_format, write_file) for element in elements]
+    measured = [table for table in tables if table.source_tokens]
+    if measured:
+        source_tokens = sum(table.source_tokens for table in measured)
+        compact_tokens = sum(count_tokens(table.text) for table in measured)
+        print(colored(
+            f"Compact tables: {len(measured)} tables, {source_tokens} HTML tokens -> {compact_tokens} "
+            f"{text_format} tokens ({1 - compact_tokens / source_tokens:.0%} fewer, "
+            f"{(source_tokens - compact_tokens) / len(measured):.0f} per table)",
+            'cyan',
+        ))
+    return tables
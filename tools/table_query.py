@@ -0,0 +1,180 @@
+import re
+
+from vectorstore.bm25 import tokenize
+from tools.table_format import CompactTable, compact_table
+
+# Words that say nothing about the row or column asked for
+QUESTION_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from how in is it its of on or per the their there "
+    "to was were what when which who with".split()
+)
+AGGREGATE_PATTERNS = {
+    "sum": re.compile(r"\b(total|sum|combined|altogether|overall)\b", re.IGNORECASE),
+    "mean": re.compile(r"\b(average|mean)\b", re.IGNORECASE),
+    "max": re.compile(r"\b(highest|largest|maximum|max|biggest)\b", re.IGNORECASE),
+    "min": re.compile(r"\b(lowest|smallest|minimum|min)\b", re.IGNORECASE),
+}
+# Questions asking for a single figure, the fast path is not tried on anything else
+LOOKUP_PATTERN = re.compile(
+    r"\b(what (is|was|are|were)|how (much|many)|value of|amount of|figure for|number of)\b", re.IGNORECASE
+)
+# Questions asking for reasons, trends or summaries need the full context even if they name a figure
+NARRATIVE_PATTERN = re.compile(
+    r"\b(why|explain|summari[sz]e|summary|describe|discuss|analy[sz]e|overview|risks?|reasons?|impact|trend)\b",
+    re.IGNORECASE,
+)
+# Rows that already aggregate the others are left out of computed aggregates
+TOTAL_ROW_PATTERN = re.compile(r"\b(total|subtotal|sum)\b", re.IGNORECASE)
+# Rows of the table passed along with a computed answer, at most
+MAX_SLICE_ROWS = 12
+
+
+def get_question_terms(question):
+    return set(tokenize(question)) - QUESTION_STOPWORDS
+
+
+def _overlap(terms, text):
+    return len(terms & set(tokenize(text)))
+
+
+def get_question_operation(question):
+    """
+    Operation asked by question ("lookup", "sum", "mean", "max", "min"),
+    None if it is not a clear lookup or aggregate question.
+    """
+    if NARRATIVE_PATTERN.search(question):
+        return None
+    operation = next((name for name, pattern in AGGREGATE_PATTERNS.items() if pattern.search(question)), None)
+    if operation is None and LOOKUP_PATTERN.search(question):
+        operation = "lookup"
+    return operation
+
+
+def format_number(value):
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.4g}"
+
+
+class TableAnswer:
+    def __init__(self, operation, value, table, column, row_positions, rank):
+        """
+        Result of the table fast path: the looked up or computed value, the
+        column it comes from and the body rows it was read from.
+        """
+        self.operation = operation
+        self.value = value
+        self.table = table
+        self.column = column
+        self.row_positions = row_positions
+        self.rank = rank
+
+    def __repr__(self):
+        return f"TableAnswer(operation={self.operation!r}, column={self.column!r}, value={self.value!r})"
+
+    @property
+    def text(self):
+        """
+        The rows used and the answer, as a small Markdown slice of the table.
+        """
+        table = self.table
+        column_index = table.column_names.index(self.column)
+        label_indices = [i for i, column_type in enumerate(table.column_types) if column_type == "text"][:1]
+        indices = label_indices + [column_index]
+        rows = [table.body[position] for position in self.row_positions[:MAX_SLICE_ROWS]]
+        lines = [
+            f"Table on page {table.metadata.page_number}:",
+            "| " + " | ".join(table.header[i] for i in indices) + " |",
+            "|" + "---|" * len(indices),
+        ]
+        lines += ["| " + " | ".join(row[i] for i in indices) + " |" for row in rows]
+        if len(self.row_positions) > MAX_SLICE_ROWS:
+            lines.append(f"({len(self.row_positions) - MAX_SLICE_ROWS} more rows)")
+        if self.operation == "lookup":
+            lines.append(f"Value of {table.header[column_index]}: {rows[0][column_index]}")
+        else:
+            lines.append(
+                f"Computed {self.operation} of {table.header[column_index]} over "
+                f"{len(self.row_positions)} rows: {format_number(self.value)}"
+            )
+        return "\n".join(lines)
+
+
+class TableQueryEngine:
+    def __init__(self, max_tables=3):
+        """
+        Answers lookup and aggregate questions (sum, mean, max, min)
+        exactly from the dataframes of the retrieved tables. The retrieval
+        ranking picks the candidate tables, the question terms pick the
+        column by its header and the rows by their labels.
+        """
+        self.max_tables = max_tables
+
+    def answer(self, question, table_entries):
+        """
+        table_entries are table DocEntry values in retrieval order. Returns a
+        TableAnswer, or None if the question is not a lookup or aggregate or
+        no table row and column clearly match it.
+        """
+        operation = get_question_operation(question)
+        if operation is None:
+            return None
+        terms = get_question_terms(question)
+        best = None
+        for rank, entry in enumerate(table_entries[:self.max_tables]):
+            table = entry.content
+            if not isinstance(table, CompactTable):
+                table = compact_table(table, write_file=False)  # Stored before tables were normalized
+            match = self.match_table(table, terms, operation)
+            if match is not None and (best is None or match[0] > best[0]):
+                best = (*match, table, rank)
+        if best is None:
+            return None
+
+        _, operation, column, row_positions, table, rank = best
+        series = table.to_dataframe()[column].iloc[row_positions].dropna()
+        if series.empty:
+            return None
+        if operation == "lookup":
+            value = series.iloc[0]
+        elif operation in ("max", "min"):
+            position = series.idxmax() if operation == "max" else series.idxmin()
+            value = series.loc[position]
+            # The row holding the extreme value comes first, it answers "which" questions
+            row_positions = [position] + [row for row in row_positions if row != position]
+        else:
+            value = getattr(series, operation)()
+        return TableAnswer(operation, float(value), table, column, list(row_positions), rank)
+
+    def match_table(self, table, terms, operation):
+        """
+        Returns (score, operation, column name, body row positions) of the best
+        matching numeric column and rows of table, None unless both a column
+        header and a row label match terms. An aggregate over a single matching row becomes a lookup of it, e.g.
+        a "Total revenue" row.
+        """
+        if not table.body:
+            return None
+        numeric = [i for i, column_type in enumerate(table.column_types) if column_type == "number"]
+        column_scores = {i: _overlap(terms, table.header[i]) for i in numeric}
+        column_index = max(column_scores, key=column_scores.get, default=None)
+        if column_index is None or column_scores[column_index] == 0:
+            return None
+
+        # The terms that picked the column do not count again for the rows
+        row_terms = terms - set(tokenize(table.header[column_index]))
+        row_scores = [
+            _overlap(row_terms, " ".join(cell for i, cell in enumerate(row) if i != column_index))
+            for row in table.body
+        ]
+        top_score = max(row_scores)
+        if top_score == 0:
+            return None
+        row_positions = []
+        if operation != "lookup":
+            row_positions = [
+                position for position, row in enumerate(table.body)
+                if not TOTAL_ROW_PATTERN.search(" ".join(row)) and row_scores[position] > 0
+            ]
+        if len(row_positions) < 2:
+            operation, row_positions = "lookup", [row_scores.index(top_score)]
+        return column_scores[column_index] + top_score, operation, table.column_names[column_index], row_positions
+
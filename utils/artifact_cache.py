@@ -0,0 +1,72 @@
+import os
+import json
+import pickle
+import hashlib
+
+# Root directory of the content-addressed ingestion artifacts
+ARTIFACT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "artifacts")
+)
+
+
+class ArtifactCache:
+    def __init__(self, root=ARTIFACT_CACHE_DIR):
+        """
+        Content-addressed on-disk cache for the outputs of the ingestion stages
+        (partitioned PDF elements, chunk summaries, ...). Every stage has its own
+        namespace and every artifact is stored as one pickle file.
+        """
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Builds a stable key from everything the artifact depends on.
+        """
+        serialized = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.root, stage, key[:2], f"{key}.pkl")
+
+    def contains(self, stage, key):
+        # Checks the file only, without loading the artifact
+        return os.path.exists(self._path(stage, key))
+
+    def get(self, stage, key, default=None):
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        except (pickle.UnpicklingError, EOFError) as e:
+            print(f"Artifact cache: dropping unreadable artifact {path}: {e}")
+            os.remove(path)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, stage, key, value):
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically, so a crash never leaves a half written artifact behind
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def get_many(self, stage, keys):
+        return [self.get(stage, key) for key in keys]
+
+    def put_many(self, stage, key_value_pairs):
+        for key, value in key_value_pairs:
+            self.put(stage, key, value)
+
+
+# Shared by all ingestion stages in this process
+artifact_cache = ArtifactCache()
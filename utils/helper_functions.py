@@ -1,4 +1,5 @@
 import os
+import hashlib
 from datetime import datetime, timezone
 import yaml
 from textwrap import wrap
@@ -31,6 +32,20 @@ def get_current_utc_datetime():
     current_time_utc = now_utc.strftime("%Y-%m-%d %H:%M:%S %Z")
     return current_time_utc
 
+# for identifying a file by its content instead of its (temporary) path
+def get_file_hash(file_path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+# for identifying a chunk (text, table or base64 image) by its content
+def get_content_hash(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
 # for checking if an attribute of the state dict has content.
 def check_for_content(var):
     if var:
@@ -0,0 +1,156 @@
+"""
+Compares the ANN index types against exact (flat) search.
+
+    python -m vectorstore.benchmark --vectors 100000 --dim 256 --queries 500 --k 10
+
+Reports recall@k against IndexFlatL2 and p50/p99 single-query latency.
+Pass --data with a .npy file of embeddings to benchmark on real vectors.
+
+    python -m vectorstore.benchmark --quantization --index-type flat --rerank-factor 4
+
+compares float32 storage with fp16, int8 and PQ codes instead: memory per
+vector and recall on the held-out queries, with and without full precision re-ranking.
+"""
+import time
+import argparse
+
+import numpy as np
+
+from vectorstore.index_factory import (
+    INDEX_TYPES,
+    QUANTIZATION_TYPES,
+    DEFAULT_NPROBE,
+    DEFAULT_EF_SEARCH,
+    build_index,
+    set_search_params,
+    estimate_index_bytes,
+)
+from vectorstore.quantization import DEFAULT_RERANK_FACTOR, rerank
+
+
+def make_clustered_vectors(num_vectors, dimension, num_clusters=100, seed=0):
+    """
+    Synthetic embeddings grouped around random centroids, closer to real data than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(num_clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, size=num_vectors)
+    noise = rng.normal(scale=0.3, size=(num_vectors, dimension)).astype(np.float32)
+    return centroids[assignments] + noise
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(index, queries, k):
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append(ids[0])
+    return np.array(results), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def run_benchmark(vectors, queries, k=10, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    rows = []
+    truth = None
+    for index_type in INDEX_TYPES:
+        started = time.perf_counter()
+        index = build_index(index_type, vectors)
+        build_seconds = time.perf_counter() - started
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+        found, p50, p99 = time_queries(index, queries, k)
+        if truth is None:  # INDEX_TYPES starts with the exact flat index
+            truth = found
+        rows.append({
+            "index_type": index_type,
+            "build_s": build_seconds,
+            "recall": recall_at_k(found, truth, k),
+            "p50_ms": p50,
+            "p99_ms": p99,
+            "bytes_per_vector": estimate_index_bytes(index) / index.ntotal,
+        })
+    return rows
+
+
+def run_quantization_benchmark(vectors, queries, k=10, index_type="flat", rerank_factor=DEFAULT_RERANK_FACTOR,
+                               nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    """
+    Recall of every quantization against exact search, reading k results
+    directly and re-ranking rerank_factor * k candidates with the float32 vectors.
+    """
+    truth, _, _ = time_queries(build_index("flat", vectors), queries, k)
+    rows = []
+    for quantization in (None,) + QUANTIZATION_TYPES:
+        index = build_index(index_type, vectors, quantization)
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+        found, _, _ = time_queries(index, queries, k)
+
+        latencies = []
+        reranked = []
+        for query in queries:
+            started = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), k * rerank_factor)
+            ids, _ = rerank(query, ids[0], lambda positions: vectors[positions], k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            reranked.append(list(ids))
+        rows.append({
+            "quantization": quantization or "float32",
+            "bytes_per_vector": estimate_index_bytes(index) / index.ntotal,
+            "recall": recall_at_k(found, truth, k),
+            "recall_reranked": recall_at_k(reranked, truth, k),
+            "p50_ms": np.percentile(latencies, 50),
+        })
+    baseline = rows[0]["recall"]
+    for row in rows:
+        row["recall_delta"] = row["recall_reranked"] - baseline
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH)
+    parser.add_argument("--data", help="optional .npy file with embeddings (one per row)")
+    parser.add_argument("--quantization", action="store_true", help="compare vector quantizations instead of index types")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES, help="index used with --quantization")
+    parser.add_argument("--rerank-factor", type=int, default=DEFAULT_RERANK_FACTOR)
+    args = parser.parse_args()
+
+    if args.data:
+        vectors = np.load(args.data).astype(np.float32)
+    else:
+        vectors = make_clustered_vectors(args.vectors + args.queries, args.dim)
+    # Held-out queries are not part of the index
+    queries, vectors = vectors[:args.queries], np.ascontiguousarray(vectors[args.queries:])
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    if args.quantization:
+        print(f"{'codes':<10}{'B/vector':>10}{'recall@k':>10}{'reranked':>10}{'delta':>10}{'p50 ms':>10}")
+        for row in run_quantization_benchmark(vectors, queries, args.k, args.index_type, args.rerank_factor,
+                                              args.nprobe, args.ef_search):
+            print(
+                f"{row['quantization']:<10}{row['bytes_per_vector']:>10.0f}{row['recall']:>10.3f}"
+                f"{row['recall_reranked']:>10.3f}{row['recall_delta']:>+10.3f}{row['p50_ms']:>10.3f}"
+            )
+        return
+
+    print(f"{'index':<10}{'build s':>10}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'B/vector':>10}")
+    for row in run_benchmark(vectors, queries, args.k, args.nprobe, args.ef_search):
+        print(
+            f"{row['index_type']:<10}{row['build_s']:>10.2f}{row['recall']:>10.3f}"
+            f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['bytes_per_vector']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import base64
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Root directory of the image payloads spilled out of the docstores
+BLOB_STORE_DIR = os.environ.get(
+    "BLOB_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "blobs")
+)
+# Upper bound for the raw bytes of the recently read blobs kept in memory (32 MiB)
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+# Reference counts of the stored files, next to them
+REFERENCES_FILE = "references.sqlite"
+
+
+class ReferenceCounts:
+    def __init__(self, db_path):
+        """
+        Number of docstore entries referring to every content-addressed file,
+        shared by all vectorstores. The database is opened on first use.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            # Transactions are opened explicitly, so a release and its file removal are atomic
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS refs (key TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        return self._conn
+
+    def acquire(self, key):
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO refs (key, count) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET count = count + 1",
+                (key,),
+            )
+
+    def release(self, key, on_last=None):
+        """
+        Drops one reference to key. on_last() runs when it was the last one,
+        before another reference can be taken. Returns the references left,
+        None for keys stored before they were counted, which are kept.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT count FROM refs WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    remaining = None
+                elif row[0] > 1:
+                    remaining = row[0] - 1
+                    conn.execute("UPDATE refs SET count = ? WHERE key = ?", (remaining, key))
+                else:
+                    remaining = 0
+                    conn.execute("DELETE FROM refs WHERE key = ?", (key,))
+                    if on_last is not None:
+                        on_last()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return remaining
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobStore:
+    def __init__(self, root=BLOB_STORE_DIR, cache_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Content-addressed store of raw binary payloads (decoded images) on disk.
+        A handle is the sha256 of the bytes, so identical images are written once.
+        Recently read blobs stay in a least-recently-used cache of cache_bytes.
+        Every put takes a reference to the blob, release drops it and deletes
+        the blob with the last one.
+        """
+        self.root = root
+        self.references = ReferenceCounts(os.path.join(root, REFERENCES_FILE))
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # handle -> bytes
+        self._lock = threading.Lock()
+
+    def _path(self, handle):
+        return os.path.join(self.root, handle[:2], f"{handle}.bin")
+
+    def put(self, data):
+        """
+        Writes data unless it is already stored and returns its handle.
+        """
+        handle = hashlib.sha256(data).hexdigest()
+        path = self._path(handle)
+        # Counted first, a concurrent release of the last reference then removes the file before the check below
+        self.references.acquire(handle)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique temporary name, concurrent writers of the same blob both succeed
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        return handle
+
+    def get(self, handle):
+        """
+        Returns the bytes of handle, None if it is not stored.
+        """
+        with self._lock:
+            data = self._cache.get(handle)
+            if data is not None:
+                self._cache.move_to_end(handle)
+                self.hits += 1
+                return data
+        try:
+            with open(self._path(handle), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self.misses += 1
+            if len(data) <= self.cache_bytes and handle not in self._cache:
+                self._cache[handle] = data
+                self.cached_bytes += len(data)
+                while self.cached_bytes > self.cache_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self.cached_bytes -= len(evicted)
+        return data
+
+    def release(self, handle):
+        """
+        Drops one reference to handle, the blob is deleted with the last one.
+        """
+        def remove():
+            remove_file(self._path(handle))
+            with self._lock:
+                data = self._cache.pop(handle, None)
+                if data is not None:
+                    self.cached_bytes -= len(data)
+
+        return self.references.release(handle, on_last=remove)
+
+    def get_base64(self, handle):
+        data = self.get(handle)
+        return base64.b64encode(data).decode("ascii") if data is not None else None
+
+
+blob_store = BlobStore()
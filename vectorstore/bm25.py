@@ -0,0 +1,98 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words and identifiers such as "A-113/2", "4.2.1" or "BRK.B", kept whole
+TOKEN_PATTERN = re.compile(r"\w(?:[\w.\-/]*\w)?")
+TOKEN_PART_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """
+    Lowercased tokens of text. Compound identifiers are kept whole and also
+    split into their parts, so "ISO-9001" matches both "iso-9001" and "9001".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = TOKEN_PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        """
+        In-process inverted index ranking documents with Okapi BM25.
+        Documents can be added and removed incrementally.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.doc_sources = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_ids, texts, source_ids=None):
+        source_ids = source_ids or [None] * len(doc_ids)
+        for doc_id, text, source_id in zip(doc_ids, texts, source_ids):
+            if doc_id in self.doc_lengths:
+                self.remove([doc_id])
+            tokens = tokenize(text or "")
+            for term, frequency in Counter(tokens).items():
+                self.postings.setdefault(term, {})[doc_id] = frequency
+            self.doc_lengths[doc_id] = len(tokens)
+            self.doc_sources[doc_id] = source_id
+            self.total_length += len(tokens)
+
+    def remove(self, doc_ids):
+        doc_ids = {doc_id for doc_id in doc_ids if doc_id in self.doc_lengths}
+        if not doc_ids:
+            return
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for doc_id in doc_ids & postings.keys():
+                del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        for doc_id in doc_ids:
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            self.doc_sources.pop(doc_id, None)
+
+    def set_source(self, doc_ids, source_id):
+        for doc_id in doc_ids:
+            if doc_id in self.doc_sources:
+                self.doc_sources[doc_id] = source_id
+
+    def search(self, query, k=4, source_ids=None):
+        """
+        Returns up to k (doc_id, score) pairs, best first, optionally only of the given sources.
+        """
+        if not self.doc_lengths:
+            return []
+        allowed = set(source_ids) if source_ids is not None else None
+        average_length = self.total_length / len(self.doc_lengths) or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.doc_lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if allowed is not None and self.doc_sources.get(doc_id) not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def estimate_bytes(self):
+        # Rough size of the dict entries holding the postings and document stats
+        return sum(len(term) + 100 * len(postings) for term, postings in self.postings.items()) + 200 * len(self.doc_lengths)
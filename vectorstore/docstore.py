@@ -0,0 +1,63 @@
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.stores import BaseStore
+
+
+class SQLiteDocStore(BaseStore[str, Any]):
+    def __init__(self, db_path):
+        """
+        On-disk key-value store for the original texts, tables and images.
+        Values are pickled into a single SQLite file, so opening the store of an
+        already ingested document is one file open.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docstore (key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM docstore WHERE key IN ({placeholders})", list(keys)
+            ).fetchall()
+        found = {key: pickle.loads(value) for key, value in rows}
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, Any]]) -> None:
+        rows = [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in key_value_pairs]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO docstore (key, value) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM docstore WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM docstore WHERE key LIKE ? ESCAPE '\\'",
+                    (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",),
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM docstore").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
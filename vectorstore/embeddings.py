@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import List
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from utils.helper_functions import get_content_hash
+from vectorstore.docstore import SQLiteDocStore
+from tools.summary_scheduler import count_tokens, pack_by_token_budget
+
+# Output dimension of the known embedding models, saves a probe request per ingestion
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Maximum number of inputs the OpenAI embeddings endpoint accepts per request
+MAX_EMBEDDING_BATCH_SIZE = 2048
+# Input tokens sent per request, below the 300k per-request limit of the endpoint
+# with a margin for the difference between the local tokenizer and the server count
+MAX_EMBEDDING_BATCH_TOKENS = 250_000
+# Query vectors kept in memory, queries are not written to the persistent cache
+QUERY_CACHE_SIZE = 256
+
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "embeddings.sqlite")
+)
+
+_dimension_lock = threading.Lock()
+
+
+def get_embedding_dimension(model, embeddings=None):
+    """
+    Returns the vector dimension of model. Unknown models are probed once
+    with embeddings and then remembered for the rest of the process.
+    """
+    with _dimension_lock:
+        if model not in EMBEDDING_DIMENSIONS:
+            if embeddings is None:
+                raise ValueError(f"Unknown dimension for embedding model {model}.")
+            EMBEDDING_DIMENSIONS[model] = len(embeddings.embed_query("hello world"))
+        return EMBEDDING_DIMENSIONS[model]
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, model, cache_path=EMBEDDING_CACHE_PATH, batch_size=MAX_EMBEDDING_BATCH_SIZE,
+                 batch_tokens=MAX_EMBEDDING_BATCH_TOKENS, query_cache_size=QUERY_CACHE_SIZE):
+        """
+        OpenAI embeddings with a persistent cache keyed by text hash and model.
+        Only texts not seen before are sent, in requests of up to batch_size
+        inputs and batch_tokens tokens. Query vectors are kept in a small
+        in-memory LRU instead.
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.client = OpenAIEmbeddings(model=model, chunk_size=batch_size)
+        self.cache = SQLiteDocStore(cache_path)
+        self.query_cache_size = query_cache_size
+        self.query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _cache_key(self, text):
+        return f"{self.model}:{get_content_hash(text)}"
+
+    def _embed_batches(self, texts):
+        """
+        Embeds texts in requests within the input count and token limits of the endpoint.
+        """
+        vectors = []
+        for pack in pack_by_token_budget([count_tokens(text, self.model) for text in texts], self.batch_tokens):
+            for start in range(0, len(pack), self.batch_size):
+                vectors.extend(self.client.embed_documents([texts[i] for i in pack[start:start + self.batch_size]]))
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._cache_key(text) for text in texts]
+        cached = self.cache.mget(keys)
+
+        # Embed every missing text once, even if it occurs several times
+        missing = {}
+        for key, text, vector in zip(keys, texts, cached):
+            if vector is None:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for vector in cached if vector is None)
+        self.misses += sum(1 for vector in cached if vector is None)
+
+        if missing:
+            vectors = self._embed_batches(list(missing.values()))
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32).tobytes()
+                for key, vector in zip(missing.keys(), vectors)
+            }
+            self.cache.mset(list(new_vectors.items()))
+            cached = [new_vectors.get(key) if vector is None else vector for key, vector in zip(keys, cached)]
+
+        return [np.frombuffer(vector, dtype=np.float32).tolist() for vector in cached]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._cache_key(text)
+        with self._query_lock:
+            vector = self.query_cache.get(key)
+            if vector is not None:
+                self.query_cache.move_to_end(key)
+                self.hits += 1
+                return vector
+        vector = self.client.embed_query(text)
+        with self._query_lock:
+            self.misses += 1
+            self.query_cache[key] = vector
+            while len(self.query_cache) > self.query_cache_size:
+                self.query_cache.popitem(last=False)
+        return vector
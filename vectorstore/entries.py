@@ -0,0 +1,120 @@
+import base64
+import binascii
+
+from vectorstore.blobstore import blob_store
+from tools.table_format import acquire_table_file, release_table_file
+
+MODALITIES = ("text", "table", "image")
+
+# Image payloads kept under their own docstore key by earlier versions
+PAYLOAD_KEY_SUFFIX = ":payload"
+
+
+def get_element_modality(element):
+    if isinstance(element, str):  # Images are extracted as base64 strings
+        return "image"
+    if "Table" in type(element).__name__:
+        return "table"
+    return "text"
+
+
+def get_payload_key(doc_id):
+    return doc_id + PAYLOAD_KEY_SUFFIX
+
+
+class DocEntry:
+    blob_handle = None  # Entries pickled before image payloads were spilled have none
+
+    def __init__(self, modality, content=None, size=0, page_number=None, source_id=None, payload_key=None,
+                 blob_handle=None):
+        """
+        Docstore value of one element, tagged with its modality and size.
+        content is the unstructured element for texts and tables. Images keep
+        only the blob_handle of their raw bytes in the blob store (or the
+        payload_key of a base64 docstore value) until load() is called.
+        """
+        if modality not in MODALITIES:
+            raise ValueError(f"Unknown modality: {modality}. Choose one of {MODALITIES}.")
+        self.modality = modality
+        self.content = content
+        self.size = size
+        self.page_number = page_number
+        self.source_id = source_id
+        self.payload_key = payload_key
+        self.blob_handle = blob_handle
+
+    def __repr__(self):
+        return f"DocEntry(modality={self.modality!r}, size={self.size}, page_number={self.page_number})"
+
+    @property
+    def text(self):
+        if self.modality == "image":
+            return ""
+        return getattr(self.content, "text", "") or ""
+
+    def load(self, docstore=None):
+        """
+        Returns the content, images as base64. A deferred image payload is read
+        from the blob store (or docstore) and not kept on the entry, so it is
+        freed with the prompt.
+        """
+        if self.content is not None:
+            return self.content
+        if self.blob_handle is not None:
+            return blob_store.get_base64(self.blob_handle)
+        if self.payload_key is not None and docstore is not None:
+            return docstore.mget([self.payload_key])[0]
+        return None
+
+
+def make_entry(element, page_number=None, source_id=None):
+    modality = get_element_modality(element)
+    if modality == "image":
+        size = len(element)
+    else:
+        size = len(getattr(element, "text", "") or "")
+        size += len(getattr(getattr(element, "metadata", None), "text_as_html", None) or "")
+    return DocEntry(modality, element, size, page_number, source_id)
+
+
+def make_docstore_items(doc_id, entry, store=blob_store):
+    """
+    Returns the (key, value) pairs storing entry. Image payloads are written
+    to store as raw bytes, the docstore only keeps their handle. The blob and
+    table side file are referenced until release_entries.
+    """
+    data_path = getattr(entry.content, "data_path", None)
+    if entry.modality == "table" and data_path is not None:
+        acquire_table_file(data_path)
+    if entry.modality != "image" or entry.content is None:
+        return [(doc_id, entry)]
+    try:
+        data = base64.b64decode(entry.content, validate=True)
+    except (binascii.Error, ValueError):
+        return [(doc_id, entry)]  # Not base64, kept as it is
+    spilled = DocEntry(
+        entry.modality, None, len(data), entry.page_number, entry.source_id, blob_handle=store.put(data)
+    )
+    return [(doc_id, spilled)]
+
+
+def release_entries(values, store=blob_store):
+    """
+    Drops the references of deleted docstore values to their blobs and
+    table side files, the files no entry refers to any more are deleted.
+    """
+    for value in values:
+        if not isinstance(value, DocEntry):
+            continue
+        if value.blob_handle is not None:
+            store.release(value.blob_handle)
+        data_path = getattr(value.content, "data_path", None)
+        if value.modality == "table" and data_path is not None:
+            release_table_file(data_path)
+
+
+def as_entry(value):
+    """
+    Wraps raw elements of stores written before entries were typed.
+    """
+    return value if isinstance(value, DocEntry) else make_entry(value)
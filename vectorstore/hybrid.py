@@ -0,0 +1,56 @@
+from typing import Any, List, Optional
+
+from langchain.retrievers.multi_vector import MultiVectorRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+
+# Rank offset of reciprocal rank fusion, damps the weight of the first ranks
+RRF_K = 60
+DEFAULT_LEXICAL_K = 4
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """
+    Merges several ranked id lists, scoring every id with sum(1 / (rrf_k + rank)).
+    Returns the ids ordered by fused score.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(MultiVectorRetriever):
+    """
+    MultiVectorRetriever that also ranks the raw element text with BM25 and
+    fuses both rankings, so exact identifiers missing from the summaries are found.
+    The vector side returns search_kwargs["k"] results, the lexical side lexical_k,
+    the fused list is cut to k (defaults to the vector k).
+    """
+
+    lexical_index: Any = None
+    lexical_k: int = DEFAULT_LEXICAL_K
+    k: Optional[int] = None
+    rrf_k: int = RRF_K
+    source_ids: Optional[List[str]] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.lexical_index is None or self.lexical_k <= 0:
+            return super()._get_relevant_documents(query, run_manager=run_manager)
+
+        vector_ids = []
+        for sub_doc in self.vectorstore.similarity_search(query, **self.search_kwargs):
+            doc_id = sub_doc.metadata.get(self.id_key)
+            if doc_id is not None and doc_id not in vector_ids:
+                vector_ids.append(doc_id)
+        lexical_ids = [
+            doc_id for doc_id, _ in self.lexical_index.search(query, self.lexical_k, self.source_ids)
+        ]
+
+        k = self.k or self.search_kwargs.get("k", 4)
+        ids = reciprocal_rank_fusion([vector_ids, lexical_ids], self.rrf_k)[:k]
+        docs = self.docstore.mget(ids)
+        return [doc for doc in docs if doc is not None]
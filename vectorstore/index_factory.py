@@ -0,0 +1,268 @@
+import math
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from vectorstore.quantization import DEFAULT_RERANK_FACTOR, rerank
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# Compressed vector codes: half floats, 8 bit scalar quantization, product quantization
+QUANTIZATION_TYPES = ("fp16", "int8", "pq")
+SCALAR_QUANTIZER_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Corpus sizes (number of vectors) up to which each index type is picked by "auto"
+AUTO_FLAT_MAX_VECTORS = 20_000
+AUTO_HNSW_MAX_VECTORS = 200_000
+AUTO_IVF_FLAT_MAX_VECTORS = 2_000_000
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+PQ_MAX_SUBQUANTIZERS = 64
+# k-means wants about this many training points per centroid
+TRAINING_POINTS_PER_CENTROID = 39
+
+_search_lock = threading.Lock()
+
+
+def choose_index_type(num_vectors):
+    """
+    Picks the index type for a corpus of num_vectors vectors.
+    """
+    if num_vectors <= AUTO_FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= AUTO_HNSW_MAX_VECTORS:
+        return "hnsw"
+    if num_vectors <= AUTO_IVF_FLAT_MAX_VECTORS:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def get_nlist(num_vectors):
+    """
+    Number of IVF lists: about 4 * sqrt(n), limited by the available training points.
+    """
+    nlist = int(4 * math.sqrt(max(num_vectors, 1)))
+    return max(1, min(nlist, num_vectors // TRAINING_POINTS_PER_CENTROID))
+
+
+def get_pq_subquantizers(dimension):
+    return max(m for m in range(1, PQ_MAX_SUBQUANTIZERS + 1) if dimension % m == 0)
+
+
+def get_pq_nbits(num_vectors):
+    # 8 bit codes need 256 centroids per sub-quantizer, use fewer bits on small corpora
+    return max(1, min(8, int(math.log2(max(num_vectors // TRAINING_POINTS_PER_CENTROID, 2)))))
+
+
+def resolve_index_config(index_type, quantization=None):
+    """
+    The (index_type, quantization) an index created with these arguments
+    reports: product quantized IVF indexes are ivf_pq with "pq" codes.
+    """
+    if index_type in ("ivf_flat", "ivf_pq") and (index_type == "ivf_pq" or quantization == "pq"):
+        return "ivf_pq", "pq"
+    return index_type, quantization
+
+
+def create_index(index_type, dimension, num_vectors=0, quantization=None):
+    """
+    Creates an empty L2 index of index_type sized for num_vectors vectors.
+    quantization stores compressed codes instead of float32 vectors,
+    ivf_pq is always product quantized.
+    IVF and quantized indexes have to be trained before vectors are added.
+    """
+    if quantization is not None and quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"Unknown quantization: {quantization}. Choose one of {QUANTIZATION_TYPES}.")
+    if index_type == "ivf_flat" and quantization == "pq":
+        index_type = "ivf_pq"
+
+    if index_type == "flat":
+        if quantization == "pq":
+            return faiss.IndexPQ(dimension, get_pq_subquantizers(dimension), get_pq_nbits(num_vectors), faiss.METRIC_L2)
+        if quantization is not None:
+            return faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZER_TYPES[quantization], faiss.METRIC_L2)
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        if quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimension, get_pq_subquantizers(dimension), HNSW_M, get_pq_nbits(num_vectors))
+        elif quantization is not None:
+            index = faiss.IndexHNSWSQ(dimension, SCALAR_QUANTIZER_TYPES[quantization], HNSW_M)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = DEFAULT_EF_SEARCH
+        return index
+
+    nlist = get_nlist(num_vectors)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat" and quantization is not None:
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, dimension, nlist, SCALAR_QUANTIZER_TYPES[quantization], faiss.METRIC_L2
+        )
+    elif index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
+    elif index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, get_pq_subquantizers(dimension), get_pq_nbits(num_vectors))
+    else:
+        raise ValueError(f"Unknown index type: {index_type}. Choose one of {INDEX_TYPES}.")
+    index.nprobe = min(DEFAULT_NPROBE, nlist)
+    return index
+
+
+def build_index(index_type, vectors, quantization=None):
+    """
+    Creates an index of index_type, trains it on vectors if needed and adds them.
+    """
+    index = create_index(index_type, vectors.shape[1], len(vectors), quantization)
+    if not index.is_trained:
+        # k-means needs at least two points for the smallest (1 bit) PQ codebooks
+        index.train(vectors if len(vectors) > 1 else np.repeat(vectors, 2, axis=0))
+    index.add(vectors)
+    return index
+
+
+def remove_vectors(index, positions):
+    """
+    Removes the vectors at positions from index in place, the following vectors
+    move up so positions stay contiguous. Returns False for HNSW indexes, whose
+    graph cannot drop vectors, they have to be rebuilt.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return False
+    positions = np.unique(np.asarray(positions, dtype=np.int64))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        index.remove_ids(positions)  # Flat codes are shifted like the positions
+        return True
+
+    ntotal = index.ntotal
+    # An array direct map cannot remove entries, the hashtable finds them without scanning all lists
+    direct_map_type = ivf.direct_map.type
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.remove_ids(positions)
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    # IVF entries keep the ids they were added with, renumber them to the new positions
+    new_ids = np.arange(ntotal, dtype=np.int64) - np.searchsorted(positions, np.arange(ntotal))
+    for list_no in range(ivf.nlist):
+        list_size = ivf.invlists.list_size(list_no)
+        if list_size:
+            ids = faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), list_size)
+            ids[:] = new_ids[ids]
+    ivf.set_direct_map_type(direct_map_type)
+    return True
+
+
+def get_index_type(index):
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def get_index_quantization(index):
+    """
+    Returns the quantization of the stored vectors, None for float32.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        index = faiss.downcast_index(ivf)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return {qtype: name for name, qtype in SCALAR_QUANTIZER_TYPES.items()}.get(index.sq.qtype, "int8")
+    return None
+
+
+def get_code_size(index):
+    # Bytes stored per vector, float32 indexes store 4 bytes per dimension
+    return getattr(index, "code_size", index.d * 4)
+
+
+def estimate_index_bytes(index):
+    """
+    Approximate memory held by the vectors and structures of the index.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        # vector codes plus 2 * M neighbour ids on the base level
+        return index.ntotal * (get_code_size(faiss.downcast_index(index.storage)) + index.hnsw.nb_neighbors(0) * 4)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # codes plus 64 bit ids in the inverted lists, plus the coarse centroids
+        return index.ntotal * (ivf.code_size + 8) + ivf.nlist * index.d * 4
+    return index.ntotal * get_code_size(index)
+
+
+def get_search_params(index):
+    ivf = faiss.try_extract_index_ivf(index)
+    return {
+        "nprobe": ivf.nprobe if ivf is not None else None,
+        "ef_search": index.hnsw.efSearch if isinstance(index, faiss.IndexHNSW) else None,
+    }
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Sets the recall/speed trade-off of the index, ignoring parameters it does not have.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe is not None:
+        ivf.nprobe = nprobe
+    if isinstance(index, faiss.IndexHNSW) and ef_search is not None:
+        index.hnsw.efSearch = ef_search
+
+
+class TunableFAISS(FAISS):
+    """
+    FAISS vectorstore accepting nprobe and ef_search as search kwargs,
+    e.g. MultiVectorRetriever(search_kwargs={"k": 4, "nprobe": 32}).
+    With full_vectors set (a FullPrecisionStore), rerank_factor times more
+    candidates are read from the compressed index and re-ranked at full precision.
+    """
+
+    full_vectors = None
+    rerank_factor = DEFAULT_RERANK_FACTOR
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, **kwargs):
+        nprobe = kwargs.pop("nprobe", None)
+        ef_search = kwargs.pop("ef_search", None)
+        if nprobe is None and ef_search is None:
+            return self._search(embedding, k, filter, fetch_k, **kwargs)
+
+        # The parameters live on the shared index, restore them after the query
+        with _search_lock:
+            previous = get_search_params(self.index)
+            set_search_params(self.index, nprobe, ef_search)
+            try:
+                return self._search(embedding, k, filter, fetch_k, **kwargs)
+            finally:
+                set_search_params(self.index, **previous)
+
+    def _search(self, embedding, k, filter, fetch_k, **kwargs):
+        if self.full_vectors is None:
+            return super().similarity_search_with_score_by_vector(embedding, k, filter, fetch_k, **kwargs)
+
+        candidates = (fetch_k if filter is not None else k) * self.rerank_factor
+        _, indices = self.index.search(np.asarray([embedding], dtype=np.float32), candidates)
+        positions, distances = rerank(embedding, indices[0], self.full_vectors.get)
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        docs = []
+        for position, distance in zip(positions, distances):
+            doc = self.docstore.search(self.index_to_docstore_id[int(position)])
+            if filter_func is not None and not filter_func(doc.metadata):
+                continue
+            docs.append((doc, float(distance)))
+            if len(docs) == k:
+                break
+        return docs
@@ -0,0 +1,77 @@
+import os
+import weakref
+import tempfile
+
+import numpy as np
+
+# Candidates fetched from the compressed index per requested result, re-ranked at full precision
+DEFAULT_RERANK_FACTOR = 4
+
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class FullPrecisionStore:
+    def __init__(self, path=None, dimension=None):
+        """
+        Append-only file of float32 vectors in index order, read through a
+        memory map so only the re-ranked rows are paged in.
+        Without a path the vectors go to a temporary file removed with the store.
+        """
+        if path is None:
+            file_descriptor, path = tempfile.mkstemp(suffix=".f32")
+            os.close(file_descriptor)
+            weakref.finalize(self, _remove_file, path)
+        self.path = path
+        self.dimension = dimension
+        self._vectors = None
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (4 * self.dimension)
+
+    def _open(self):
+        if len(self) == 0:  # An empty file cannot be memory-mapped
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self._vectors is None:
+            self._vectors = np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self), self.dimension))
+        return self._vectors
+
+    def append(self, vectors):
+        with open(self.path, "ab") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._vectors = None
+
+    def reset(self, vectors):
+        self._vectors = None
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        os.replace(self.path + ".tmp", self.path)
+
+    def get(self, positions):
+        return np.asarray(self._open()[positions])
+
+    def get_all(self):
+        return np.array(self._open())
+
+    def remove(self, positions):
+        keep = np.ones(len(self), dtype=bool)
+        keep[list(positions)] = False
+        self.reset(self._open()[keep])
+
+
+def rerank(query, candidate_ids, full_vectors, k=None):
+    """
+    Orders candidate_ids by exact squared L2 distance to query.
+    full_vectors(ids) returns the float32 vectors of the candidates.
+    Returns the ids and distances, best first.
+    """
+    candidate_ids = np.asarray([i for i in candidate_ids if i != -1], dtype=np.int64)
+    if len(candidate_ids) == 0:
+        return candidate_ids, np.empty(0, dtype=np.float32)
+    distances = ((full_vectors(candidate_ids) - np.asarray(query, dtype=np.float32).reshape(1, -1)) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return candidate_ids[order], distances[order]
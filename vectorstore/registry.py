@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+from termcolor import colored
+
+# Upper bound for the estimated memory held by all cached retrievers (1 GiB)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class RetrieverRegistry:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Process-wide cache of live retrievers keyed by (file hash, embedding model).
+        Entries are evicted in least-recently-used order once the summed
+        memory footprint exceeds max_bytes.
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (retriever, footprint)
+        self._lock = threading.RLock()
+        self._build_locks = {}
+
+    @staticmethod
+    def make_key(file_hash, embedding_model):
+        return (file_hash, embedding_model)
+
+    def get(self, key):
+        """
+        Returns the cached retriever for key (marking it as recently used) or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, retriever, footprint=0):
+        """
+        Stores a retriever together with its estimated memory footprint in bytes.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (retriever, footprint)
+            self.total_bytes += footprint
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached retriever for key. On a miss, factory() is called once
+        (concurrent callers for the same key wait for it) and must return a
+        (retriever, footprint) tuple.
+        """
+        retriever = self.get(key)
+        if retriever is not None:
+            print(colored(f"Retriever registry: hit for {key[0][:12]}", 'green'))
+            return retriever
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Another caller may have built it while we were waiting
+            retriever = self.get(key)
+            if retriever is None:
+                print(colored(f"Retriever registry: miss for {key[0][:12]}", 'yellow'))
+                retriever, footprint = factory()
+                self.put(key, retriever, footprint)
+
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return retriever
+
+    def evict(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _evict(self):
+        # Always keep the most recently inserted entry, even if it alone exceeds the limit
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (_, footprint) = self._entries.popitem(last=False)
+            self.total_bytes -= footprint
+            print(colored(f"Retriever registry: evicted {key[0][:12]} ({footprint} bytes)", 'yellow'))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# Shared by every PDFReporterAgent in this process
+retriever_registry = RetrieverRegistry()
@@ -1,51 +1,465 @@
 import os
 import uuid
+import pickle
 import faiss
-from langchain_community.vectorstores import FAISS
+import numpy as np
 from langchain.storage import InMemoryStore
 from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain.schema.document import Document
-from langchain_openai import OpenAIEmbeddings
-from langchain.retrievers.multi_vector import MultiVectorRetriever
 
 from utils.helper_functions import load_config
+from vectorstore.bm25 import BM25Index
+from vectorstore.docstore import SQLiteDocStore
+from vectorstore.hybrid import HybridRetriever, DEFAULT_LEXICAL_K
+from vectorstore.entries import (
+    DocEntry,
+    PAYLOAD_KEY_SUFFIX,
+    get_payload_key,
+    make_entry,
+    make_docstore_items,
+    release_entries,
+    get_element_modality,
+)
+from vectorstore.embeddings import CachedEmbeddings, get_embedding_dimension
+from vectorstore.index_factory import (
+    TunableFAISS,
+    build_index,
+    choose_index_type,
+    get_index_type,
+    get_index_quantization,
+    resolve_index_config,
+    estimate_index_bytes,
+    remove_vectors,
+)
+from vectorstore.quantization import FullPrecisionStore, DEFAULT_RERANK_FACTOR
 
 # Load configuration
 config_path = os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml")
 load_config(config_path)
 
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Root directory of the persisted per-document vectorstores
+VECTORSTORE_DIR = os.environ.get(
+    "VECTORSTORE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "vectorstores")
+)
+
+INDEX_FILE = "index.faiss"
+INDEX_META_FILE = "index.pkl"
+DOCSTORE_FILE = "docstore.sqlite"
+LEXICAL_INDEX_FILE = "bm25.pkl"
+FULL_VECTORS_FILE = "vectors.f32"
+
+# Number of streamed summaries embedded together
+STREAM_FLUSH_SIZE = 256
+# Candidates fetched before filtering by document in a shared corpus
+CORPUS_FETCH_K = 200
+
+
+def get_persist_dir(file_hash, embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Returns the directory holding the persisted vectorstore of one document.
+    """
+    return os.path.join(VECTORSTORE_DIR, embedding_model, file_hash)
+
+
+def get_corpus_dir(corpus_name="default", embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """
+    Returns the directory holding a vectorstore shared by many documents.
+    """
+    return os.path.join(VECTORSTORE_DIR, embedding_model, "corpus", corpus_name)
+
+
+def get_element_text(element):
+    if isinstance(element, DocEntry):
+        return element.text
+    # Image elements are stored as base64 strings and have no text to index
+    return "" if isinstance(element, str) else getattr(element, "text", "") or ""
+
+
+def get_page_number(element):
+    metadata = getattr(element, "metadata", None)
+    return getattr(metadata, "page_number", None)
+
+
+def get_page_numbers(element):
+    """
+    Pages an element spans, including those of the elements a chunk was built from.
+    """
+    page_numbers = {get_page_number(element)}
+    for orig_element in getattr(getattr(element, "metadata", None), "orig_elements", None) or []:
+        page_numbers.add(get_page_number(orig_element))
+    return page_numbers - {None}
+
+
 class VectorStoreManager:
-    def __init__(self, id_key="doc_id"):
+    def __init__(self, id_key="doc_id", embedding_model=DEFAULT_EMBEDDING_MODEL, persist_dir=None,
+                 index_type="flat", search_kwargs=None, lexical_k=DEFAULT_LEXICAL_K, fused_k=None,
+                 quantization=None, rerank_factor=DEFAULT_RERANK_FACTOR):
         """
         Initialize the VectorStoreManager instance.
+        If persist_dir is given, the index and the docstore are kept on disk in that directory.
+        index_type is one of "flat", "ivf_flat", "ivf_pq", "hnsw" or "auto" (picked from the corpus size).
+        search_kwargs go to the retriever, e.g. {"k": 4, "nprobe": 16, "ef_search": 64}.
+        lexical_k BM25 results are fused with the vector results and the best
+        fused_k (default: the vector k) are returned, lexical_k=0 disables BM25.
+        quantization ("fp16", "int8" or "pq") keeps compressed vectors in the index
+        and the float32 vectors on disk, rerank_factor * k candidates are re-ranked with them.
         """
         self.id_key = id_key
+        self.embedding_model = embedding_model
+        self.persist_dir = persist_dir
+        self.index_type = index_type
+        self.search_kwargs = search_kwargs or {}
+        self.lexical_k = lexical_k
+        self.fused_k = fused_k
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.memory_mapped = False
         self.vectorstore = None
+        self.lexical_index = None
         self.retriever = None
+        self._pending = []
 
     def create_vectorstore(self):
         """
-        Creates the retriever with an empty FAISS vectorstore and an in-memory store.
+        Creates the retriever with an empty FAISS vectorstore and a docstore
+        (on disk if persist_dir is set, in memory otherwise).
         """
         # Create an empty vectorstore
-        embeddings = OpenAIEmbeddings()
-        index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
+        embeddings = CachedEmbeddings(model=self.embedding_model)
+        index = faiss.IndexFlatL2(get_embedding_dimension(self.embedding_model, embeddings))
 
-        self.vectorstore = FAISS(
+        # Vectors are collected in a flat index, build_ann_index() converts it once all are added
+        self.vectorstore = TunableFAISS(
             embedding_function=embeddings,
             index=index,
             docstore=InMemoryDocstore(),
             index_to_docstore_id={},
         )
-        # Create an in-memory store for documents
-        store = InMemoryStore()
+        self.memory_mapped = False
+        self.lexical_index = BM25Index()
+        docstore = self._create_docstore()
+        # Drop leftovers of an interrupted ingestion into the same directory
+        leftover_keys = list(docstore.yield_keys())
+        leftovers = docstore.mget(leftover_keys)
+        docstore.mdelete(leftover_keys)
+        release_entries(leftovers)
         # Create the retriever
-        self.retriever = MultiVectorRetriever(
+        self.retriever = self._create_retriever(docstore)
+        print("Vectorstore created successfully.")
+
+    def _create_retriever(self, docstore):
+        return HybridRetriever(
             vectorstore=self.vectorstore,
-            docstore=store,
-            id_key=self.id_key
+            docstore=docstore,
+            id_key=self.id_key,
+            search_kwargs=self.search_kwargs,
+            lexical_index=self.lexical_index,
+            lexical_k=self.lexical_k,
+            k=self.fused_k,
         )
-        print("Vectorstore created successfully.")
+
+    def _create_docstore(self):
+        if self.persist_dir is None:
+            return InMemoryStore()
+        return SQLiteDocStore(os.path.join(self.persist_dir, DOCSTORE_FILE))
+
+    def vectorstore_exists(self):
+        """
+        Checks whether a complete vectorstore was saved in persist_dir.
+        """
+        if self.persist_dir is None:
+            return False
+        return all(
+            os.path.exists(os.path.join(self.persist_dir, file_name))
+            for file_name in (INDEX_FILE, INDEX_META_FILE, DOCSTORE_FILE)
+        )
+
+    def build_ann_index(self):
+        """
+        Converts the index into the configured index type, training it on all
+        vectors. Ingestion fills a flat index, so this runs once all vectors are
+        added. Positions are kept, so the mapping to the summary documents stays valid.
+        """
+        index = self.vectorstore.index
+        index_type = choose_index_type(index.ntotal) if self.index_type == "auto" else self.index_type
+        current = (get_index_type(index), get_index_quantization(index))
+        if current == resolve_index_config(index_type, self.quantization) or index.ntotal == 0:
+            return
+
+        vectors = self._get_vectors()
+        self.vectorstore.index = build_index(index_type, vectors, self.quantization)
+        self.memory_mapped = False
+        # Lossy codes (ivf_pq included) keep the float32 vectors, later rebuilds read them back
+        index_type, quantization = get_index_type(self.vectorstore.index), get_index_quantization(self.vectorstore.index)
+        if quantization is not None:
+            self._set_full_vectors(vectors)
+        else:
+            self.vectorstore.full_vectors = None
+        print(f"Built {index_type} index over {index.ntotal} vectors{f' ({quantization} codes)' if quantization else ''}.")
+
+    def _set_full_vectors(self, vectors):
+        """
+        Writes the float32 vectors used for re-ranking, next to the index if it is persisted.
+        """
+        path = None
+        if self.persist_dir is not None:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            path = os.path.join(self.persist_dir, FULL_VECTORS_FILE)
+        full_vectors = FullPrecisionStore(path, vectors.shape[1])
+        full_vectors.reset(vectors)
+        self.vectorstore.full_vectors = full_vectors
+        self.vectorstore.rerank_factor = self.rerank_factor
+
+    def _get_vectors(self):
+        """
+        Returns all vectors in index order. Exact copies are read back from the
+        full precision store or the index where it keeps them. Compressed codes
+        are lossy, stores saved without their float32 vectors embed the
+        summaries again, mostly from the embedding cache.
+        """
+        index = self.vectorstore.index
+        if self.vectorstore.full_vectors is not None:
+            return self.vectorstore.full_vectors.get_all()
+        if get_index_quantization(index) is None:
+            if get_index_type(index) == "ivf_flat":
+                faiss.extract_index_ivf(index).make_direct_map()
+            return index.reconstruct_n(0, index.ntotal)
+
+        texts = [
+            self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i]).page_content
+            for i in range(index.ntotal)
+        ]
+        return np.asarray(self.vectorstore.embedding_function.embed_documents(texts), dtype=np.float32)
+
+    def list_documents(self):
+        """
+        Returns the source ids of all documents in the vectorstore.
+        """
+        return {doc.metadata.get("source_id") for doc in self.vectorstore.docstore._dict.values()} - {None}
+
+    def remove_document(self, source_id):
+        """
+        Deletes the vectors and the stored elements of one document.
+        """
+        summary_ids = [
+            doc_id for doc_id, doc in self.vectorstore.docstore._dict.items()
+            if doc.metadata.get("source_id") == source_id
+        ]
+        self._remove_summaries(summary_ids)
+        print(f"Removed {len(summary_ids)} vectors of document {source_id[:12]}.")
+        return len(summary_ids)
+
+    def remove_pages(self, source_id, page_numbers):
+        """
+        Deletes the vectors of one document whose elements touch any of page_numbers.
+        Returns all pages spanned by the removed elements.
+        """
+        page_numbers = set(page_numbers)
+        summary_ids = []
+        touched_pages = set()
+        for doc_id, doc in self.vectorstore.docstore._dict.items():
+            doc_pages = set(self._get_summary_pages(doc))
+            if doc.metadata.get("source_id") == source_id and doc_pages & page_numbers:
+                summary_ids.append(doc_id)
+                touched_pages |= doc_pages
+        self._remove_summaries(summary_ids)
+        print(f"Removed {len(summary_ids)} vectors on {len(page_numbers)} pages of document {source_id[:12]}.")
+        return touched_pages
+
+    @staticmethod
+    def _get_summary_pages(doc):
+        page_numbers = doc.metadata.get("page_numbers")
+        if page_numbers is None:  # Stores saved before page spans were recorded
+            page_numbers = [doc.metadata.get("page_number")]
+        return [page_number for page_number in page_numbers if page_number is not None]
+
+    def _remove_summaries(self, summary_ids):
+        """
+        Deletes summary vectors and their elements. Flat and IVF indexes remove
+        the vectors in place, HNSW graphs are rebuilt from the remaining vectors.
+        Removing the last vector leaves an empty flat index, as a new store starts.
+        """
+        self.flush()
+        if not summary_ids:
+            return
+        element_ids = [self.vectorstore.docstore.search(doc_id).metadata[self.id_key] for doc_id in summary_ids]
+
+        removed = set(summary_ids)
+        positions = sorted(self.vectorstore.index_to_docstore_id.items())
+        removed_positions = [i for i, doc_id in positions if doc_id in removed]
+        keep = [i for i, doc_id in positions if doc_id not in removed]
+        full_vectors = self.vectorstore.full_vectors
+        self._own_index()
+        index = self.vectorstore.index
+        if not keep:
+            self.vectorstore.index = faiss.IndexFlatL2(index.d)
+            if full_vectors is not None:
+                full_vectors.reset(np.empty((0, index.d), dtype=np.float32))
+        elif remove_vectors(index, removed_positions):
+            if full_vectors is not None:
+                full_vectors.remove(removed_positions)
+        else:
+            vectors = self._get_vectors()[keep]
+            self.vectorstore.index = build_index(get_index_type(index), vectors, get_index_quantization(index))
+            if full_vectors is not None:
+                full_vectors.reset(vectors)
+        self.vectorstore.docstore.delete(summary_ids)
+        self.vectorstore.index_to_docstore_id = {
+            new_position: self.vectorstore.index_to_docstore_id[old_position]
+            for new_position, old_position in enumerate(keep)
+        }
+        entries = self.retriever.docstore.mget(element_ids)
+        self.retriever.docstore.mdelete(element_ids + [get_payload_key(element_id) for element_id in element_ids])
+        # Blobs and table side files are shared by identical elements, they go with their last entry
+        release_entries(entries)
+        self.lexical_index.remove(element_ids)
+
+    def revise_document(self, source_id, new_source_id, page_map, changed_pages, new_page_count, new_spans):
+        """
+        Turns a document into its revision new_source_id. page_map maps every
+        unchanged old page to its new page, changed_pages are the other old
+        pages and new_spans the pages of every chunk of the revision. The elements sharing a page with a changed one,
+        on either side, are deleted and their pages come back from the revision,
+        the rest are moved to it. Returns the new pages to ingest.
+        """
+        old_spans = [
+            set(self._get_summary_pages(doc)) for doc in self.vectorstore.docstore._dict.values()
+            if doc.metadata.get("source_id") == source_id and doc.metadata.get("modality") != "image"
+        ]
+        new_to_old = {new_page: old_page for old_page, new_page in page_map.items()}
+        pages = set(range(1, new_page_count + 1)) - new_to_old.keys()
+        # Grown to whole chunks until no kept element shares a page with an ingested one
+        while True:
+            old_pages = {new_to_old[page] for page in pages if page in new_to_old}
+            old_pages |= set(changed_pages)
+            for span in old_spans:
+                if span & old_pages:
+                    old_pages |= span
+            grown = pages | {page_map[page] for page in old_pages if page in page_map}
+            for span in new_spans:
+                if span & grown:
+                    grown |= span
+            if grown == pages:
+                break
+            pages = grown
+        # Images are deleted with their pages but do not grow them, a logo on every page would take them all
+        self.remove_pages(source_id, old_pages)
+        self.relabel_document(source_id, new_source_id, page_map)
+        return pages
+
+    def relabel_document(self, source_id, new_source_id, page_map=None):
+        """
+        Moves the remaining vectors of a document to new_source_id, e.g. a new
+        revision of it, renumbering their pages with page_map (old -> new page).
+        """
+        page_map = page_map or {}
+        element_ids = []
+        for doc in self.vectorstore.docstore._dict.values():
+            if doc.metadata.get("source_id") != source_id:
+                continue
+            doc.metadata["source_id"] = new_source_id
+            doc.metadata["page_number"] = page_map.get(doc.metadata.get("page_number"), doc.metadata.get("page_number"))
+            doc.metadata["page_numbers"] = [page_map.get(page, page) for page in self._get_summary_pages(doc)]
+            element_ids.append(doc.metadata[self.id_key])
+
+        entries = self.retriever.docstore.mget(element_ids)
+        updated = []
+        for element_id, entry in zip(element_ids, entries):
+            if isinstance(entry, DocEntry):
+                entry.source_id = new_source_id
+                entry.page_number = page_map.get(entry.page_number, entry.page_number)
+                updated.append((element_id, entry))
+        self.retriever.docstore.mset(updated)
+        self.lexical_index.set_source(element_ids, new_source_id)
+        return len(element_ids)
+
+    def save_vectorstore(self):
+        """
+        Writes the FAISS index and the summary documents to persist_dir.
+        The original elements are already on disk in the SQLite docstore.
+        """
+        if self.persist_dir is None:
+            raise ValueError("No persist_dir was given to VectorStoreManager.")
+        if self.vectorstore is None:
+            raise ValueError("Vectorstore has not been created. Please run create_vectorstore() first.")
+        os.makedirs(self.persist_dir, exist_ok=True)
+
+        # Write to temporary files first, the index file marks a complete save
+        meta_path = os.path.join(self.persist_dir, INDEX_META_FILE)
+        with open(meta_path + ".tmp", "wb") as file:
+            pickle.dump(
+                (self.vectorstore.docstore, self.vectorstore.index_to_docstore_id),
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(meta_path + ".tmp", meta_path)
+
+        lexical_path = os.path.join(self.persist_dir, LEXICAL_INDEX_FILE)
+        with open(lexical_path + ".tmp", "wb") as file:
+            pickle.dump(self.lexical_index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(lexical_path + ".tmp", lexical_path)
+
+        index_path = os.path.join(self.persist_dir, INDEX_FILE)
+        faiss.write_index(self.vectorstore.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        print(f"Vectorstore saved to {self.persist_dir}.")
+
+    def load_vectorstore(self, mmap=True):
+        """
+        Loads a previously saved vectorstore from persist_dir.
+        With mmap=True the vector codes of the FAISS index are used in place
+        from the memory-mapped file (faiss >= 1.11), so worker processes opening
+        the same document share one copy of its pages. A mapped index is copied
+        into memory before it is modified.
+        Returns False if nothing has been saved yet.
+        """
+        if not self.vectorstore_exists():
+            return False
+
+        io_flags = faiss.IO_FLAG_MMAP_IFC if mmap else 0
+        index = faiss.read_index(os.path.join(self.persist_dir, INDEX_FILE), io_flags)
+        with open(os.path.join(self.persist_dir, INDEX_META_FILE), "rb") as file:
+            summary_docstore, index_to_docstore_id = pickle.load(file)
+
+        self.vectorstore = TunableFAISS(
+            embedding_function=CachedEmbeddings(model=self.embedding_model),
+            index=index,
+            docstore=summary_docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+        self.memory_mapped = mmap
+        full_vectors_path = os.path.join(self.persist_dir, FULL_VECTORS_FILE)
+        if get_index_quantization(index) is not None and os.path.exists(full_vectors_path):
+            self.vectorstore.full_vectors = FullPrecisionStore(full_vectors_path, index.d)
+            self.vectorstore.rerank_factor = self.rerank_factor
+        docstore = self._create_docstore()
+        lexical_path = os.path.join(self.persist_dir, LEXICAL_INDEX_FILE)
+        if os.path.exists(lexical_path):
+            with open(lexical_path, "rb") as file:
+                self.lexical_index = pickle.load(file)
+        else:
+            self.lexical_index = self._build_lexical_index(docstore)
+        self.retriever = self._create_retriever(docstore)
+        print(f"Vectorstore loaded from {self.persist_dir} ({get_index_type(index)} index).")
+        return True
+
+    def _build_lexical_index(self, docstore):
+        """
+        Indexes the stored elements of a vectorstore saved without a BM25 index.
+        """
+        source_ids = {
+            doc.metadata[self.id_key]: doc.metadata.get("source_id")
+            for doc in self.vectorstore.docstore._dict.values()
+        }
+        element_ids = [key for key in docstore.yield_keys() if not key.endswith(PAYLOAD_KEY_SUFFIX)]
+        lexical_index = BM25Index()
+        lexical_index.add(
+            element_ids,
+            [get_element_text(element) for element in docstore.mget(element_ids)],
+            [source_ids.get(element_id) for element_id in element_ids],
+        )
+        return lexical_index
 
     def add_to_vectorstore(self, texts, tables, images, text_summaries, table_summaries, image_summaries):
         """
@@ -56,51 +470,142 @@ class VectorStoreManager:
                 raise ValueError("Nothing to store in Vectorstore")
 
             print("Adding documents to vectorstore...")
-            # Add text data
-            if all((len(texts) > 0, len(text_summaries) > 0)):
-                doc_ids = [str(uuid.uuid4()) for _ in texts]
-                summary_texts = [
-                    Document(page_content=summary, metadata={self.id_key: doc_ids[i]}) 
-                    for i, summary in enumerate(text_summaries)
-                ]
-                self.vectorstore.add_documents(summary_texts)
-                self.retriever.docstore.mset(list(zip(doc_ids, texts)))
-                print("Texts were successfully added to vectorstore.")
-            else:
-                print("No texts to add to vectorstore.")
-
-            # Add table data
-            if all((len(tables) > 0, len(table_summaries) > 0)):
-                table_ids = [str(uuid.uuid4()) for _ in tables]
-                summary_tables = [
-                    Document(page_content=summary, metadata={self.id_key: table_ids[i]}) 
-                    for i, summary in enumerate(table_summaries)
-                ]
-                self.vectorstore.add_documents(summary_tables)
-                self.retriever.docstore.mset(list(zip(table_ids, tables)))
-                print("Tables were successfully added to vectorstore.")
-            else:
-                print("No tables to add to vectorstore.")
-                
-            # Add image data
-            if all((len(images) > 0, len(image_summaries) > 0)):
-                img_ids = [str(uuid.uuid4()) for _ in images]
-                summary_images = [
-                    Document(page_content=summary, metadata={self.id_key: img_ids[i]}) 
-                    for i, summary in enumerate(image_summaries)
-                ]
-                self.vectorstore.add_documents(summary_images)
-                self.retriever.docstore.mset(list(zip(img_ids, images)))
-                print("Images were successfully added to vectorstore.")
-            else:
-                print("No images to add to vectorstore.")
+            # All modalities are embedded in one batched call
+            elements = []
+            summaries = []
+            for name, modality_elements, modality_summaries in (
+                ("texts", texts, text_summaries),
+                ("tables", tables, table_summaries),
+                ("images", images, image_summaries),
+            ):
+                if all((len(modality_elements) > 0, len(modality_summaries) > 0)):
+                    elements.extend(modality_elements)
+                    summaries.extend(modality_summaries)
+                else:
+                    print(f"No {name} to add to vectorstore.")
+
+            self.add_elements(elements, summaries)
             print("All documents were added to vectorstore successfully.")
-        
+
         except Exception as e:
             print(f"Error occurred while adding documents to vectorstore: {e}")
 
-    def get_runnable_retriever(self):
+    def _own_index(self):
+        """
+        Replaces a memory-mapped index by an in-memory copy, faiss cannot grow or
+        shrink vector codes that live in a mapped file.
+        """
+        if self.memory_mapped:
+            self.vectorstore.index = faiss.deserialize_index(faiss.serialize_index(self.vectorstore.index))
+            self.memory_mapped = False
+
+    def add_elements(self, elements, summaries, source_ids=None, element_pages=None):
+        """
+        Adds elements of any modality along with their summaries to the vectorstore.
+        Every summary vector carries the source id of its document and its page number.
+        element_pages gives the pages of elements without page metadata, e.g.
+        the base64 images, None where the element metadata has them.
+        The elements are stored as DocEntry tagged with their modality and size,
+        their raw text goes into the BM25 index.
+        """
+        doc_ids = [str(uuid.uuid4()) for _ in elements]
+        source_ids = source_ids or [None] * len(elements)
+        element_pages = element_pages or [None] * len(elements)
+        spans = [
+            sorted(set(pages) - {None}) if pages is not None else sorted(get_page_numbers(element))
+            for element, pages in zip(elements, element_pages)
+        ]
+        page_numbers = [
+            get_page_number(element) if get_page_number(element) is not None else (span[0] if span else None)
+            for element, span in zip(elements, spans)
+        ]
+        metadatas = [
+            {
+                self.id_key: doc_ids[i],
+                "source_id": source_ids[i],
+                "page_number": page_numbers[i],
+                "page_numbers": spans[i],
+                "modality": get_element_modality(elements[i]),
+            }
+            for i in range(len(summaries))
+        ]
+        # Embedded here so the float32 vectors can also go to the full precision store
+        embeddings = self.vectorstore.embedding_function.embed_documents(summaries)
+        self._own_index()
+        self.vectorstore.add_embeddings(list(zip(summaries, embeddings)), metadatas=metadatas)
+        if self.vectorstore.full_vectors is not None:
+            self.vectorstore.full_vectors.append(np.asarray(embeddings, dtype=np.float32))
+        docstore_items = []
+        for doc_id, element, page_number, source_id in zip(doc_ids, elements, page_numbers, source_ids):
+            docstore_items.extend(make_docstore_items(doc_id, make_entry(element, page_number, source_id)))
+        self.retriever.docstore.mset(docstore_items)
+        self.lexical_index.add(doc_ids, [get_element_text(element) for element in elements], source_ids)
+        print(f"Embedding cache hit rate: {self.vectorstore.embedding_function.hit_rate:.0%}")
+
+    def stream_add(self, element, summary, source_id=None, pages=None, flush_size=STREAM_FLUSH_SIZE):
+        """
+        Queues one summarized element, the queue is embedded and stored every flush_size elements.
+        pages are those of an element without page metadata, see add_elements.
+        """
+        self._pending.append((element, summary, source_id, pages))
+        if len(self._pending) >= flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Stores all queued elements.
+        """
+        if not self._pending:
+            return
+        elements, summaries, source_ids, element_pages = zip(*self._pending)
+        self._pending = []
+        self.add_elements(list(elements), list(summaries), list(source_ids), list(element_pages))
+        print(f"{len(elements)} elements were added to vectorstore.")
+
+    def get_runnable_retriever(self, source_ids=None):
+        """
+        Returns the retriever, restricted to the given documents if source_ids is set.
+        """
         if self.retriever is None:
             raise ValueError("Retriever has not been created. Please run create_vectorstore() first.")  # Throw error if retriever is missing
         print("Retriever type:", type(self.retriever))
-        return self.retriever 
+        if source_ids is None:
+            return self.retriever
+        search_kwargs = {
+            "fetch_k": CORPUS_FETCH_K,
+            **self.search_kwargs,
+            "filter": {"source_id": list(source_ids)},
+        }
+        return self.retriever.copy(update={"search_kwargs": search_kwargs, "source_ids": list(source_ids)})
+
+    def estimate_memory_footprint(self):
+        """
+        Estimates the memory (in bytes) held by the vector index and the docstore.
+        """
+        footprint = 0
+        if self.vectorstore is not None:
+            # Counted even if memory-mapped, the pages touched by searches stay resident
+            footprint += estimate_index_bytes(self.vectorstore.index)
+            for doc in self.vectorstore.docstore._dict.values():
+                footprint += len(doc.page_content)
+        if self.lexical_index is not None:
+            footprint += self.lexical_index.estimate_bytes()
+        if self.retriever is not None and isinstance(self.retriever.docstore, InMemoryStore):
+            for value in self.retriever.docstore.store.values():
+                footprint += self._estimate_value_size(value)
+        return footprint
+
+    @staticmethod
+    def _estimate_value_size(value):
+        if isinstance(value, DocEntry):
+            return VectorStoreManager._estimate_value_size(value.content) if value.content is not None else 0
+        if isinstance(value, (str, bytes)):
+            return len(value)
+        size = len(getattr(value, "text", "") or "")
+        metadata = getattr(value, "metadata", None)
+        if metadata is not None:
+            size += len(getattr(metadata, "text_as_html", None) or "")
+            for element in getattr(metadata, "orig_elements", None) or []:
+                size += len(getattr(element, "text", "") or "")
+                size += len(getattr(element.metadata, "image_base64", None) or "")
+        return size